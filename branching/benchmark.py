@@ -0,0 +1,216 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import ecole
+import numpy as np
+import torch
+
+from params import SCIP_PARAMETERS
+from inference import PolicyInference
+from obs_cache import CachedObservation, ObservationCache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "generator"))
+
+# Shifts of the shifted geometric means reported in the summary
+SHIFTS = {"nb_nodes": 10.0, "time": 1.0, "primal_dual_integral": 1.0}
+
+
+def instance_path(instance_dir, family, seed):
+    """
+    Generate (once) the instance of a family for a seed and return its file. Families are
+    pseudo-<n>, zoning, setcover and tsp-<n>.
+    """
+    path = os.path.join(instance_dir, f"{family}_{seed}.lp")
+    if os.path.exists(path):
+        return path
+    os.makedirs(instance_dir, exist_ok=True)
+    tmp_path = os.path.join(instance_dir, f".tmp-{os.getpid()}-{family}_{seed}.lp")
+
+    kind, _, size = family.partition("-")
+    if kind == "pseudo":
+        from pseudo_data_gen import SchoolZoning
+        school_zoning = SchoolZoning(n=int(size), seed=seed)
+    elif kind == "zoning":
+        from batch_generate import DEFAULT_CENTROIDS
+        from zoning_generator import SchoolZoning
+        school_zoning = SchoolZoning(centroids=DEFAULT_CENTROIDS[seed % len(DEFAULT_CENTROIDS)])
+    if kind in ("pseudo", "zoning"):
+        school_zoning.add_objective()
+        school_zoning.add_feasibility_constraints()
+        school_zoning.add_balancing_constraints()
+        school_zoning.write(tmp_path, name=f"{family}_{seed}")
+    elif kind == "setcover":
+        instances = ecole.instance.SetCoverGenerator(n_rows=500, n_cols=1000, density=0.05)
+        instances.seed(seed)
+        next(instances).write_problem(tmp_path)
+    elif kind == "tsp":
+        from tsp_generator import iter_lp
+        with open(tmp_path, "w") as f:
+            for chunk in iter_lp(int(size), seed):
+                f.write(chunk)
+    else:
+        raise ValueError(f"Unknown instance family {family}")
+
+    os.replace(tmp_path, path)
+    return path
+
+
+# Per-process state of the benchmark workers
+_worker = {}
+
+
+def init_worker(policy_path, scip_parameters, cache_dir=None):
+    """
+    With a cache_dir, both solvers run on the cached presolved models and the GNN episodes
+    start from the cached root observations (see obs_cache.py).
+    """
+    torch.set_num_threads(1)
+    observation_function = ecole.observation.NodeBipartite()
+    _worker["cache"] = None
+    if cache_dir is not None:
+        _worker["cache"] = ObservationCache(cache_dir, scip_parameters)
+        observation_function = CachedObservation(observation_function, _worker["cache"])
+        scip_parameters = _worker["cache"].parameters()
+    _worker["observation_function"] = observation_function
+    information = {
+        "nb_nodes": ecole.reward.NNodes(),
+        "time": ecole.reward.SolvingTime(),
+        "primal_dual_integral": ecole.reward.PrimalDualIntegral(),
+    }
+    _worker["policy"] = PolicyInference.from_file(policy_path)
+    _worker["env"] = ecole.environment.Branching(
+        observation_function=observation_function,
+        information_function=information,
+        scip_params=scip_parameters,
+    )
+    _worker["default_env"] = ecole.environment.Configuring(
+        observation_function=None,
+        information_function=information,
+        scip_params=scip_parameters,
+    )
+
+
+def run_gnn(path, seed):
+    env, policy = _worker["env"], _worker["policy"]
+    policy.reset()
+    inference_time = policy.inference_time
+    totals = {key: 0.0 for key in SHIFTS}
+
+    cache = _worker["cache"]
+    if cache is not None:
+        _worker["observation_function"].set_instance(cache.key(path), seed)
+        path = cache.presolved(path)
+    env.seed(seed)
+    observation, action_set, _, done, info = env.reset(path)
+    for key in totals:
+        totals[key] += info[key]
+    while not done:
+        action = policy(observation, action_set)
+        observation, action_set, _, done, info = env.step(action)
+        for key in totals:
+            totals[key] += info[key]
+
+    totals["gap"] = env.model.as_pyscipopt().getGap()
+    totals["inference_time"] = policy.inference_time - inference_time
+    return totals
+
+
+def run_default(path, seed):
+    env = _worker["default_env"]
+    if _worker["cache"] is not None:
+        path = _worker["cache"].presolved(path)
+    env.seed(seed)
+    _, _, _, _, reset_info = env.reset(path)
+    _, _, _, _, info = env.step({})
+    totals = {key: reset_info[key] + info[key] for key in SHIFTS}
+    totals["gap"] = env.model.as_pyscipopt().getGap()
+    totals["inference_time"] = 0.0
+    return totals
+
+
+def run_task(task):
+    family, instance_seed, repetition, path = task
+    # The SCIP seed of a repetition is shared by both solvers
+    seed = instance_seed * 1000 + repetition
+    rows = []
+    for solver, run in (("gnn", run_gnn), ("scip", run_default)):
+        start = time.time()
+        result = run(path, seed)
+        result.update({
+            "family": family, "instance_seed": instance_seed, "repetition": repetition,
+            "solver": solver, "wall_time": time.time() - start,
+        })
+        result["inference_share"] = result["inference_time"] / max(result["wall_time"], 1e-9)
+        rows.append(result)
+    return rows
+
+
+def shifted_geometric_mean(values, shift):
+    values = np.asarray(values, dtype=np.float64)
+    return float(np.exp(np.mean(np.log(values + shift))) - shift)
+
+
+def summarize(rows):
+    """
+    Shifted geometric means of nodes, time and primal-dual integral, and the mean gap and
+    GNN inference share, per family and solver.
+    """
+    summary = []
+    for family in sorted({row["family"] for row in rows}):
+        for solver in ("gnn", "scip"):
+            group = [row for row in rows if row["family"] == family and row["solver"] == solver]
+            if not group:
+                continue
+            entry = {"family": family, "solver": solver, "runs": len(group)}
+            for key, shift in SHIFTS.items():
+                entry[key] = shifted_geometric_mean([row[key] for row in group], shift)
+            entry["gap"] = float(np.mean([row["gap"] for row in group]))
+            entry["inference_share"] = float(np.mean([row["inference_share"] for row in group]))
+            summary.append(entry)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GNN brancher against SCIP's default branching.")
+    parser.add_argument("--families", nargs="+", default=["pseudo-7"],
+                        help="instance families: pseudo-<n>, zoning, setcover, tsp-<n>")
+    parser.add_argument("--instances", type=int, default=10, help="instances (seeds 0..N-1) per family")
+    parser.add_argument("--repetitions", type=int, default=1)
+    parser.add_argument("--policy", default="trained_params_more.pkl")
+    parser.add_argument("--instance-dir", default="benchmark_instances")
+    parser.add_argument("--output", default="benchmark_results", help="output prefix (.json and .csv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--obs-cache", help="cache directory of presolved models and root observations")
+    args = parser.parse_args()
+
+    tasks = [
+        (family, seed, repetition, instance_path(args.instance_dir, family, seed))
+        for family in args.families for seed in range(args.instances) for repetition in range(args.repetitions)
+    ]
+
+    start = time.time()
+    with multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(args.policy, SCIP_PARAMETERS, args.obs_cache)) as pool:
+        rows = [row for result in pool.imap(run_task, tasks) for row in result]
+    summary = summarize(rows)
+
+    with open(args.output + ".json", "w") as f:
+        json.dump({"arguments": vars(args), "scip_parameters": SCIP_PARAMETERS, "runs": rows, "summary": summary}, f, indent=1)
+    with open(args.output + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"{len(rows)} runs in {time.time() - start:.1f}s")
+    for entry in summary:
+        print(f"{entry['family']: <12} {entry['solver']: <5} | nodes {entry['nb_nodes']: >9.1f} | time {entry['time']: >8.2f}"
+              f" | pd integral {entry['primal_dual_integral']: >10.2f} | gap {entry['gap']: >7.4f}"
+              f" | inference {100 * entry['inference_share']: >5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import glob
+import gzip
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import time
+
+import ecole
+import numpy as np
+
+from params import SCIP_PARAMETERS
+from shards import read_shard_manifest, shard_manifest_path, shard_path, write_json
+
+
+class ExploreThenStrongBranch:
+    """
+    This custom observation function class will randomly return either strong branching scores (expensive expert)
+    or pseudocost scores (weak expert for exploration) when called at every node.
+    """
+
+    def __init__(self, expert_probability):
+        self.expert_probability = expert_probability
+        self.pseudocosts_function = ecole.observation.Pseudocosts()
+        self.strong_branching_function = ecole.observation.StrongBranchingScores()
+
+    def before_reset(self, model):
+        """
+        This function will be called at initialization of the environment (before dynamics are reset).
+        """
+        self.pseudocosts_function.before_reset(model)
+        self.strong_branching_function.before_reset(model)
+
+    def extract(self, model, done):
+        """
+        Should we return strong branching or pseudocost scores at time node?
+        """
+        probabilities = [1 - self.expert_probability, self.expert_probability]
+        expert_chosen = bool(np.random.choice(np.arange(2), p=probabilities))
+        if expert_chosen:
+            return (self.strong_branching_function.extract(model, done), True)
+        else:
+            return (self.pseudocosts_function.extract(model, done), False)
+
+
+def instance_seed(seed, index):
+    """
+    Seed of the episode on instance number index, independent of the worker running it.
+    """
+    return int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+
+
+def collect_shard(config, shard):
+    """
+    Run the episodes of one shard (instances shard, shard + n_workers, ...) and append their
+    expert samples to the shard file. Each instance is written as one gzip member and recorded
+    in the shard manifest once complete, so an interrupted run resumes after the last
+    complete instance.
+    """
+    out_dir, n_workers = config["out_dir"], config["n_workers"]
+    manifest = read_shard_manifest(out_dir, shard)
+    max_samples = config["max_samples_per_shard"]
+
+    # Drop anything written after the last complete instance
+    path = shard_path(out_dir, shard)
+    with open(path, "ab") as f:
+        f.truncate(manifest["offset"])
+
+    env = ecole.environment.Branching(
+        observation_function=(
+            ExploreThenStrongBranch(expert_probability=config["expert_probability"]),
+            ecole.observation.NodeBipartite(),
+        ),
+        scip_params=config["scip_parameters"],
+    )
+
+    for index in range(shard, len(config["instances"]), n_workers):
+        instance = config["instances"][index]
+        if instance in manifest["instances"]:
+            continue
+        if max_samples is not None and manifest["n_samples"] >= max_samples:
+            break
+
+        seed = instance_seed(config["seed"], index)
+        env.seed(seed)
+        np.random.seed(seed % 2**32)
+        start, n_samples = time.time(), 0
+
+        with open(path, "ab") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            observation, action_set, _, done, _ = env.reset(ecole.scip.Model.from_file(instance))
+            while not done:
+                (scores, scores_are_expert), node_observation = observation
+                action = action_set[scores[action_set].argmax()]
+
+                # Only save samples if they are coming from the expert (strong branching)
+                under_cap = max_samples is None or manifest["n_samples"] + n_samples < max_samples
+                if scores_are_expert and under_cap:
+                    pickle.dump([node_observation, action, action_set, scores], f)
+                    n_samples += 1
+
+                observation, action_set, _, done, _ = env.step(action)
+
+        manifest["offset"] = os.path.getsize(path)
+        manifest["n_samples"] += n_samples
+        manifest["instances"][instance] = {"index": index, "seed": seed, "n_samples": n_samples,
+                                           "time": time.time() - start}
+        write_json(shard_manifest_path(out_dir, shard), manifest)
+        print(f"Shard {shard}: {instance}, {n_samples} samples ({manifest['n_samples']} in shard)")
+
+    return manifest["n_samples"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect strong branching samples in parallel.")
+    parser.add_argument("instances", nargs="+", help="instance files or glob patterns")
+    parser.add_argument("--out-dir", default="school_samples")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-samples", type=int, default=None, help="total number of samples")
+    parser.add_argument("--expert-probability", type=float, default=0.05)
+    args = parser.parse_args()
+
+    instances = sorted({path for pattern in args.instances for path in glob.glob(pattern)})
+    config = {
+        "instances": instances,
+        "n_workers": args.workers,
+        "seed": args.seed,
+        "expert_probability": args.expert_probability,
+        "max_samples_per_shard": None if args.max_samples is None else math.ceil(args.max_samples / args.workers),
+        "scip_parameters": SCIP_PARAMETERS,
+        "out_dir": args.out_dir,
+    }
+
+    # The run configuration fixes the sharding, a resumed run must use the same one
+    os.makedirs(args.out_dir, exist_ok=True)
+    manifest_path = os.path.join(args.out_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != config:
+            raise ValueError(f"{manifest_path} was written with a different configuration")
+        print("Resuming collection in", args.out_dir)
+    else:
+        write_json(manifest_path, config)
+
+    start = time.time()
+    with multiprocessing.Pool(args.workers) as pool:
+        counts = pool.starmap(collect_shard, [(config, shard) for shard in range(args.workers)])
+    print(f"{sum(counts)} samples from {len(instances)} instances in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+import pickle
+
+import numpy as np
+import torch
+import torch_geometric
+
+from shards import iter_samples
+
+# Arrays of a packed dataset: name -> (dtype, number of columns, offsets they are indexed by)
+PACKED_ARRAYS = {
+    "constraint_features": (np.float32, 5, "constraint_offsets"),
+    "edge_indices": (np.int64, 2, "edge_offsets"),
+    "edge_features": (np.float32, 1, "edge_offsets"),
+    "variable_features": (np.float32, 19, "variable_offsets"),
+    "candidates": (np.int64, None, "candidate_offsets"),
+    "candidate_scores": (np.float32, None, "candidate_offsets"),
+}
+# Offsets arrays and the array whose lengths they accumulate
+OFFSETS = {
+    "constraint_offsets": "constraint_features",
+    "edge_offsets": "edge_indices",
+    "variable_offsets": "variable_features",
+    "candidate_offsets": "candidates",
+}
+
+
+class BipartiteNodeData(torch_geometric.data.Data):
+    """
+    This class encode a node bipartite graph observation as returned by the `ecole.observation.NodeBipartite`
+    observation function in a format understood by the pytorch geometric data handlers.
+    """
+
+    def __init__(
+        self,
+        constraint_features=None,
+        edge_indices=None,
+        edge_features=None,
+        variable_features=None,
+        candidates=None,
+        nb_candidates=None,
+        candidate_choice=None,
+        candidate_scores=None,
+    ):
+        super().__init__()
+        self.constraint_features = constraint_features
+        self.edge_index = edge_indices
+        self.edge_attr = edge_features
+        self.variable_features = variable_features
+        self.candidates = candidates
+        self.nb_candidates = nb_candidates
+        self.candidate_choices = candidate_choice
+        self.candidate_scores = candidate_scores
+
+    def __inc__(self, key, value, store, *args, **kwargs):
+        """
+        We overload the pytorch geometric method that tells how to increment indices when concatenating graphs
+        for those entries (edge index, candidates) for which this is not obvious.
+        """
+        if key == "edge_index":
+            return torch.tensor(
+                [[self.constraint_features.size(0)], [self.variable_features.size(0)]]
+            )
+        elif key == "candidates":
+            return self.variable_features.size(0)
+        else:
+            return super().__inc__(key, value, *args, **kwargs)
+
+
+def sample_arrays(sample):
+    """
+    Convert a [node_observation, action, action_set, scores] sample into the arrays stored
+    for it (see PACKED_ARRAYS) plus the index of the expert choice among the candidates.
+    """
+    sample_observation, sample_action, sample_action_set, sample_scores = sample
+
+    # We note on which variables we were allowed to branch, the scores as well as the choice
+    # taken by strong branching (relative to the candidates)
+    candidates = np.array(sample_action_set, dtype=np.int64)
+    arrays = {
+        "constraint_features": sample_observation.row_features,
+        "edge_indices": sample_observation.edge_features.indices.T,
+        "edge_features": np.expand_dims(sample_observation.edge_features.values, axis=-1),
+        "variable_features": sample_observation.column_features,
+        "candidates": candidates,
+        "candidate_scores": np.array([sample_scores[j] for j in candidates]),
+    }
+    candidate_choice = np.where(candidates == sample_action)[0][0]
+    return arrays, candidate_choice
+
+
+def sample_graph(sample):
+    """
+    BipartiteNodeData graph of a [node_observation, action, action_set, scores] sample.
+    """
+    arrays, candidate_choice = sample_arrays(sample)
+    graph = BipartiteNodeData(
+        torch.FloatTensor(arrays["constraint_features"]),
+        torch.LongTensor(arrays["edge_indices"].T.astype(np.int64)),
+        torch.FloatTensor(arrays["edge_features"]),
+        torch.FloatTensor(arrays["variable_features"]),
+        torch.LongTensor(arrays["candidates"]),
+        len(arrays["candidates"]),
+        torch.LongTensor([candidate_choice]),
+        torch.FloatTensor(arrays["candidate_scores"]),
+    )
+
+    # We must tell pytorch geometric how many nodes there are, for indexing purposes
+    graph.num_nodes = arrays["constraint_features"].shape[0] + arrays["variable_features"].shape[0]
+
+    return graph
+
+
+def pack_samples(samples, out_dir):
+    """
+    Pack samples into contiguous arrays in out_dir. Every array is appended to a raw binary
+    file as samples are read, so the samples never have to fit in memory together.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    files = {name: open(os.path.join(out_dir, name + ".bin"), "wb") for name in PACKED_ARRAYS}
+    offsets = {name: [0] for name in OFFSETS}
+    choices = []
+
+    for sample in samples:
+        arrays, candidate_choice = sample_arrays(sample)
+        for name, (dtype, _, _) in PACKED_ARRAYS.items():
+            files[name].write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+        for name, array_name in OFFSETS.items():
+            offsets[name].append(offsets[name][-1] + len(arrays[array_name]))
+        choices.append(candidate_choice)
+
+    for f in files.values():
+        f.close()
+    for name in OFFSETS:
+        np.save(os.path.join(out_dir, name + ".npy"), np.array(offsets[name], dtype=np.int64))
+    np.save(os.path.join(out_dir, "candidate_choices.npy"), np.array(choices, dtype=np.int64))
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({"n_samples": len(choices)}, f)
+    return len(choices)
+
+
+def iter_sample_files(sample_files):
+    """
+    Read the per-sample gzip pickles written by the notebooks.
+    """
+    for sample_file in sample_files:
+        with gzip.open(sample_file, "rb") as f:
+            yield pickle.load(f)
+
+
+class GraphDataset(torch_geometric.data.Dataset):
+    """
+    This class encodes a collection of graphs, as well as a method to load such graphs from the disk.
+    It can be used in turn by the data loaders provided by pytorch geometric.
+    """
+
+    def __init__(self, sample_files):
+        super().__init__(root=None, transform=None, pre_transform=None)
+        self.sample_files = sample_files
+
+    def len(self):
+        return len(self.sample_files)
+
+    def get(self, index):
+        """
+        This method loads a node bipartite graph observation as saved on the disk during data collection.
+        """
+        with gzip.open(self.sample_files[index], "rb") as f:
+            sample = pickle.load(f)
+
+        return sample_graph(sample)
+
+
+class PackedGraphDataset(torch_geometric.data.Dataset):
+    """
+    Dataset over a directory written by pack_samples. The arrays are memory-mapped
+    (copy-on-write, so tensors can wrap them) and every sample is a set of zero-copy slices.
+    """
+
+    def __init__(self, packed_dir, indices=None):
+        super().__init__(root=None, transform=None, pre_transform=None)
+        self.packed_dir = packed_dir
+        self.offsets = {name: np.load(os.path.join(packed_dir, name + ".npy")) for name in OFFSETS}
+        self.candidate_choices = np.load(os.path.join(packed_dir, "candidate_choices.npy"))
+        self.arrays = {}
+        for name, (dtype, columns, offset_name) in PACKED_ARRAYS.items():
+            shape = (int(self.offsets[offset_name][-1]),) + (() if columns is None else (columns,))
+            if shape[0] == 0:
+                self.arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                self.arrays[name] = np.memmap(os.path.join(packed_dir, name + ".bin"), dtype=dtype, mode="c", shape=shape)
+        self.sample_indices = np.arange(len(self.candidate_choices)) if indices is None else np.asarray(indices)
+
+    def len(self):
+        return len(self.sample_indices)
+
+    def sizes(self):
+        """
+        (number of constraints, number of variables) of every sample of the dataset.
+        """
+        i = self.sample_indices
+        return np.stack([
+            np.diff(self.offsets["constraint_offsets"])[i],
+            np.diff(self.offsets["variable_offsets"])[i],
+        ], axis=1)
+
+    def _slice(self, name, index):
+        offsets = self.offsets[PACKED_ARRAYS[name][2]]
+        return torch.from_numpy(self.arrays[name][offsets[index]:offsets[index + 1]])
+
+    def get(self, index):
+        index = int(self.sample_indices[index])
+        candidates = self._slice("candidates", index)
+        graph = BipartiteNodeData(
+            self._slice("constraint_features", index),
+            self._slice("edge_indices", index).t(),
+            self._slice("edge_features", index),
+            self._slice("variable_features", index),
+            candidates,
+            len(candidates),
+            torch.from_numpy(self.candidate_choices[index:index + 1]),
+            self._slice("candidate_scores", index),
+        )
+
+        # We must tell pytorch geometric how many nodes there are, for indexing purposes
+        graph.num_nodes = graph.constraint_features.shape[0] + graph.variable_features.shape[0]
+
+        return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack branching samples into memory-mappable arrays.")
+    parser.add_argument("samples", help="collection directory (shards) or glob of sample_*.pkl files")
+    parser.add_argument("out_dir")
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.samples, "manifest.json")):
+        samples = iter_samples(args.samples)
+    else:
+        samples = iter_sample_files(sorted(glob.glob(args.samples)))
+    print(f"{pack_samples(samples, args.out_dir)} samples packed into {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import copy
+import time
+
+import numpy as np
+import torch
+
+from model import GNNPolicy
+
+
+class PolicyInference(object):
+    """
+    Low-overhead evaluation of a GNNPolicy inside the branching loop.
+
+    Between the nodes of one instance the bipartite graph keeps its structure and only
+    some row and column features change, so the engine keeps per-instance state:
+        - float32 feature buffers shared with the torch tensors (no per-node allocation),
+        - the edge index tensors and edge embeddings, reused while the edges are unchanged,
+        - the constraint and variable embeddings, recomputed only for the rows that changed.
+    The last half convolution is only evaluated for the branching candidates.
+    Call reset() before every new instance.
+    """
+
+    def __init__(self, policy, device="cpu", quantize=False, script=False):
+        policy = policy.to(device).eval()
+        if quantize:
+            # Dynamic int8 quantization of the linear layers, CPU only
+            policy = torch.ao.quantization.quantize_dynamic(policy, {torch.nn.Linear}, dtype=torch.qint8)
+        if script:
+            # Script a copy so the caller's policy is left untouched
+            policy = copy.deepcopy(policy)
+            for name in ("cons_embedding", "edge_embedding", "var_embedding", "output_module"):
+                setattr(policy, name, torch.jit.script(getattr(policy, name)))
+        self.policy = policy
+        self.device = torch.device(device)
+        self.inference_time = 0.0
+        self.n_calls = 0
+        # Rows re-embedded after the first node of an instance
+        self.rows_embedded = 0
+        self.reset()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        policy = GNNPolicy()
+        policy.load_state_dict(torch.load(path, map_location="cpu"))
+        return cls(policy, **kwargs)
+
+    def reset(self):
+        self.cache = {}
+
+    def _embed(self, name, features, embedding):
+        """
+        Embeddings of the rows of features, recomputing only the rows that differ from the
+        previous call.
+        """
+        # ecole features are float64, they are compared at the float32 precision of the buffer
+        features = np.asarray(features, dtype=np.float32)
+        cached = self.cache.get(name)
+        if cached is None or cached["numpy"].shape != features.shape:
+            buffer = features.copy()
+            tensor = torch.from_numpy(buffer).to(self.device)
+            cached = {"numpy": buffer, "tensor": tensor, "embedding": embedding(tensor)}
+            self.cache[name] = cached
+            return cached["embedding"]
+
+        changed = np.flatnonzero((cached["numpy"] != features).any(axis=1))
+        self.rows_embedded += len(changed)
+        if len(changed):
+            cached["numpy"][changed] = features[changed]
+            rows = torch.from_numpy(changed).to(self.device)
+            if self.device.type == "cpu":
+                # The tensor shares memory with the numpy buffer
+                values = cached["tensor"][rows]
+            else:
+                values = torch.from_numpy(cached["numpy"][changed]).to(self.device)
+                cached["tensor"][rows] = values
+            cached["embedding"][rows] = embedding(values)
+        return cached["embedding"]
+
+    def _edges(self, edge_features):
+        indices, values = edge_features.indices, edge_features.values
+        cached = self.cache.get("edges")
+        if (cached is None or cached["indices"].shape != indices.shape
+                or not np.array_equal(cached["indices"], indices)
+                or not np.array_equal(cached["values"], values)):
+            edge_index = torch.from_numpy(indices.astype(np.int64)).to(self.device)
+            edge_attr = torch.from_numpy(values.astype(np.float32)).view(-1, 1).to(self.device)
+            cached = {
+                "indices": indices.copy(),
+                "values": values.copy(),
+                "edge_index": edge_index,
+                "reversed": torch.stack([edge_index[1], edge_index[0]], dim=0),
+                "embedding": self.policy.edge_embedding(edge_attr),
+            }
+            self.cache["edges"] = cached
+        return cached
+
+    def logits(self, observation, action_set):
+        """
+        Policy logits of the candidates in action_set for an ecole NodeBipartite observation.
+        """
+        policy = self.policy
+        with torch.inference_mode():
+            edges = self._edges(observation.edge_features)
+            constraint_features = self._embed("constraints", observation.row_features, policy.cons_embedding)
+            variable_features = self._embed("variables", observation.column_features, policy.var_embedding)
+
+            constraint_features = policy.conv_v_to_c(
+                variable_features, edges["reversed"], edges["embedding"], constraint_features
+            )
+
+            # Second half convolution, restricted to the edges entering a candidate
+            candidates = torch.from_numpy(action_set.astype(np.int64)).to(self.device)
+            is_candidate = torch.zeros(variable_features.shape[0], dtype=torch.bool, device=self.device)
+            is_candidate[candidates] = True
+            keep = is_candidate[edges["edge_index"][1]]
+            conv = policy.conv_c_to_v
+            output = conv.propagate(
+                edges["edge_index"][:, keep],
+                size=(constraint_features.shape[0], variable_features.shape[0]),
+                node_features=(constraint_features, variable_features),
+                edge_features=edges["embedding"][keep],
+            )
+            output = conv.output_module(
+                torch.cat([conv.post_conv_module(output[candidates]), variable_features[candidates]], dim=-1)
+            )
+            return policy.output_module(output).squeeze(-1)
+
+    def __call__(self, observation, action_set):
+        """
+        Return the branching decision of the policy.
+        """
+        start = time.perf_counter()
+        logits = self.logits(observation, action_set)
+        action = action_set[int(logits.argmax())]
+        self.inference_time += time.perf_counter() - start
+        self.n_calls += 1
+        return action
@@ -0,0 +1,167 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import pickle
+import time
+
+from params import SCIP_PARAMETERS
+
+# Bump when the layout of the cache entries changes
+OBS_CACHE_VERSION = 1
+# Presolving is done once, when the presolved model is cached
+PRESOLVED_PARAMETERS = {"presolving/maxrounds": 0}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(path, data):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ObservationCache(object):
+    """
+    On-disk cache of presolved models and root NodeBipartite observations.
+
+    Entries live in cache_dir/<key>/, the key being the sha256 of the instance file contents
+    and of the SCIP parameters, so an edited instance or a parameter change never hits a
+    stale entry:
+        presolved.cip: the transformed problem after presolving (see presolved())
+        meta.json: instance, presolving time and problem sizes
+        root_<seed>.pkl: root observation of the presolved model for an env seed
+    Entries are written atomically, workers sharing a cache at most duplicate work.
+    """
+
+    def __init__(self, cache_dir="obs_cache", scip_parameters=SCIP_PARAMETERS):
+        self.cache_dir = cache_dir
+        self.scip_parameters = dict(scip_parameters)
+        # Instance digests, keyed by (path, size, mtime)
+        self.digests = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, instance):
+        stat = os.stat(instance)
+        file_key = (os.path.abspath(instance), stat.st_size, stat.st_mtime_ns)
+        if file_key not in self.digests:
+            self.digests[file_key] = file_digest(instance)
+        content = [OBS_CACHE_VERSION, self.digests[file_key], sorted(self.scip_parameters.items())]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+    def entry_dir(self, key):
+        path = os.path.join(self.cache_dir, key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def parameters(self):
+        """
+        SCIP parameters for solving the presolved models: the cached ones without presolving.
+        """
+        return {**self.scip_parameters, **PRESOLVED_PARAMETERS}
+
+    def presolved(self, instance):
+        """
+        Path of the presolved model of an instance, presolving and writing it on a miss.
+        """
+        key = self.key(instance)
+        path = os.path.join(self.entry_dir(key), "presolved.cip")
+        if os.path.exists(path):
+            return path
+
+        from pyscipopt import Model
+        model = Model()
+        model.hideOutput()
+        model.readProblem(instance)
+        model.setParams(self.scip_parameters)
+        start = time.time()
+        model.presolve()
+        presolve_time = time.time() - start
+
+        tmp_path = f"{path}.tmp-{os.getpid()}.cip"
+        model.writeProblem(tmp_path, trans=True, verbose=False)
+        os.replace(tmp_path, path)
+        meta = {
+            "instance": os.path.abspath(instance), "scip_parameters": self.scip_parameters,
+            "presolve_time": presolve_time, "variables": model.getNVars(False), "constraints": model.getNConss(False),
+            "presolved_variables": model.getNVars(True), "presolved_constraints": model.getNConss(True),
+        }
+        atomic_write(os.path.join(self.entry_dir(key), "meta.json"), json.dumps(meta, indent=1).encode())
+        return path
+
+    def _observation_path(self, key, seed):
+        return os.path.join(self.entry_dir(key), f"root_{seed}.pkl")
+
+    def load_observation(self, key, seed):
+        path = self._observation_path(key, seed)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def store_observation(self, key, seed, observation):
+        atomic_write(self._observation_path(key, seed), pickle.dumps(observation))
+
+
+class CachedObservation(object):
+    """
+    Observation function wrapper returning the cached root observation of the instance set
+    with set_instance() instead of extracting it, and caching it on a miss. The observations
+    of the other nodes are extracted by the wrapped function as usual.
+    """
+
+    def __init__(self, function, cache):
+        self.function = function
+        self.cache = cache
+        self.key, self.seed = None, None
+        self.hits, self.misses = 0, 0
+
+    def set_instance(self, key, seed):
+        """
+        Cache key and env seed of the next episode, None to disable the cache for it.
+        """
+        self.key, self.seed = key, seed
+
+    def before_reset(self, model):
+        self.function.before_reset(model)
+        self.at_root = True
+
+    def extract(self, model, done):
+        if not self.at_root or self.key is None or done:
+            self.at_root = False
+            return self.function.extract(model, done)
+
+        self.at_root = False
+        observation = self.cache.load_observation(self.key, self.seed)
+        if observation is not None:
+            self.hits += 1
+            return observation
+        self.misses += 1
+        observation = self.function.extract(model, done)
+        self.cache.store_observation(self.key, self.seed, observation)
+        return observation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presolve instances into the observation cache.")
+    parser.add_argument("instances", nargs="+", help="instance files or glob patterns")
+    parser.add_argument("--cache-dir", default="obs_cache")
+    args = parser.parse_args()
+
+    cache = ObservationCache(args.cache_dir)
+    for instance in sorted({path for pattern in args.instances for path in glob.glob(pattern)}):
+        start = time.time()
+        path = cache.presolved(instance)
+        print(f"{instance} -> {path} ({time.time() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import glob
+import os
+import queue
+import time
+
+import ecole
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+import torch_geometric
+
+from collect_samples import ExploreThenStrongBranch, instance_seed
+from dataset import sample_graph
+from model import GNNPolicy
+from params import SCIP_PARAMETERS
+from train import process
+
+
+def collect(config, worker, samples, stop):
+    """
+    Collector process: run episodes on the instances of the worker (worker, worker +
+    n_workers, ...), cycling over them with a new seed every pass, and put the expert
+    samples in the samples queue as graphs until stop is set. The graph tensors are moved
+    to shared memory by the queue, the trainer receives them without a copy.
+    """
+    torch.set_num_threads(1)
+    env = ecole.environment.Branching(
+        observation_function=(
+            ExploreThenStrongBranch(expert_probability=config["expert_probability"]),
+            ecole.observation.NodeBipartite(),
+        ),
+        scip_params=config["scip_parameters"],
+    )
+    instances = config["instances"]
+    indices = range(worker, len(instances), config["n_workers"])
+    if not indices:
+        return
+    episode = 0
+    while not stop.is_set():
+        for index in indices:
+            seed = instance_seed(config["seed"], episode * len(instances) + index)
+            env.seed(seed)
+            np.random.seed(seed % 2**32)
+
+            observation, action_set, _, done, _ = env.reset(ecole.scip.Model.from_file(instances[index]))
+            while not done and not stop.is_set():
+                (scores, scores_are_expert), node_observation = observation
+                action = action_set[scores[action_set].argmax()]
+
+                # Only keep samples if they are coming from the expert (strong branching)
+                if scores_are_expert:
+                    graph = sample_graph([node_observation, action, action_set, scores])
+                    # Wait for room in the queue, unless the run is over
+                    while not stop.is_set():
+                        try:
+                            samples.put(graph, timeout=1)
+                            break
+                        except queue.Full:
+                            pass
+
+                observation, action_set, _, done, _ = env.step(action)
+            if stop.is_set():
+                return
+        episode += 1
+
+
+class ReplayBuffer(object):
+    """
+    Bounded buffer of sample graphs. Once full, every new sample evicts the oldest one.
+    """
+
+    def __init__(self, capacity, seed=0):
+        self.capacity = capacity
+        self.samples = []
+        self.next = 0
+        self.n_added = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, sample):
+        if len(self.samples) < self.capacity:
+            self.samples.append(sample)
+        else:
+            self.samples[self.next] = sample
+        self.next = (self.next + 1) % self.capacity
+        self.n_added += 1
+
+    def drain(self, samples, max_samples=None):
+        """
+        Move the samples waiting in a queue into the buffer, without blocking. Returns the
+        number of samples moved.
+        """
+        moved = 0
+        while max_samples is None or moved < max_samples:
+            try:
+                self.add(samples.get_nowait())
+            except queue.Empty:
+                break
+            moved += 1
+        return moved
+
+    def sample(self, batch_size):
+        """
+        Batch of distinct samples drawn uniformly from the buffer.
+        """
+        indices = self.rng.choice(len(self.samples), size=min(batch_size, len(self.samples)), replace=False)
+        return torch_geometric.data.Batch.from_data_list([self.samples[i] for i in indices])
+
+
+def checkpoint(policy, path):
+    """
+    Save the policy parameters atomically, so a reader never sees a partial file.
+    """
+    torch.save(policy.state_dict(), path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def train_online(policy, samples, buffer, optimizer, max_steps=None, time_limit=None, min_samples=256,
+                 batch_size=32, checkpoint_every=500, output="trained_params_online.pkl", keep_checkpoints=False,
+                 log_every=50, device="cpu"):
+    """
+    Trainer loop: move the collected samples into the replay buffer and take optimizer steps
+    on batches drawn from it, checkpointing every checkpoint_every steps. Waits for
+    min_samples samples before the first step and stops after max_steps steps, time_limit
+    seconds or on KeyboardInterrupt. Returns the number of steps taken.
+    """
+    start = time.time()
+    step, window = 0, []
+    try:
+        while (max_steps is None or step < max_steps) and (time_limit is None or time.time() - start < time_limit):
+            if buffer.drain(samples) == 0 and len(buffer) < min_samples:
+                time.sleep(0.1)
+                continue
+            if len(buffer) < min_samples:
+                continue
+
+            loss, accuracy, _ = process(policy, [buffer.sample(batch_size)], optimizer, device)
+            window.append((loss, accuracy))
+            step += 1
+
+            if step % log_every == 0:
+                elapsed = time.time() - start
+                loss, accuracy = np.mean(window, axis=0)
+                print(f"Step {step}: loss {loss:0.3f}, accuracy {accuracy:0.3f} | buffer {len(buffer)},"
+                      f" {buffer.n_added} samples collected ({buffer.n_added / elapsed:.1f}/s), {step / elapsed:.1f} steps/s")
+                window = []
+            if step % checkpoint_every == 0:
+                checkpoint(policy, output)
+                if keep_checkpoints:
+                    root, ext = os.path.splitext(output)
+                    checkpoint(policy, f"{root}_{step:07d}{ext}")
+    except KeyboardInterrupt:
+        # Interrupting the run still leaves a checkpoint of the last step
+        print("Interrupted")
+    checkpoint(policy, output)
+    return step
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect strong branching samples and train the GNN policy on them concurrently.")
+    parser.add_argument("instances", nargs="+", help="instance files or glob patterns")
+    parser.add_argument("--collectors", type=int, default=max(1, os.cpu_count() - 1), help="collector processes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--expert-probability", type=float, default=0.05)
+    parser.add_argument("--buffer-size", type=int, default=20000, help="samples kept in the replay buffer")
+    parser.add_argument("--queue-size", type=int, default=1000, help="samples waiting for the trainer")
+    parser.add_argument("--min-samples", type=int, default=256, help="samples collected before the first step")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--max-steps", type=int, default=None)
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds")
+    parser.add_argument("--checkpoint-every", type=int, default=500, help="optimizer steps")
+    parser.add_argument("--output", default="trained_params_online.pkl")
+    parser.add_argument("--keep-checkpoints", action="store_true", help="also keep a copy of every checkpoint")
+    parser.add_argument("--init", help="parameters to start from, e.g. trained_params_more.pkl")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    instances = sorted({path for pattern in args.instances for path in glob.glob(pattern)})
+    if not instances:
+        raise ValueError(f"No instance matches {args.instances}")
+    # A collector without an instance of its own would have nothing to run
+    n_collectors = min(args.collectors, len(instances))
+    config = {
+        "instances": instances,
+        "n_workers": n_collectors,
+        "seed": args.seed,
+        "expert_probability": args.expert_probability,
+        "scip_parameters": SCIP_PARAMETERS,
+    }
+
+    # Buffered samples each hold several shared tensors, more than file descriptors allow
+    mp.set_sharing_strategy("file_system")
+    samples, stop = mp.Queue(args.queue_size), mp.Event()
+    collectors = [mp.Process(target=collect, args=(config, worker, samples, stop), daemon=True)
+                  for worker in range(n_collectors)]
+    for process_ in collectors:
+        process_.start()
+
+    torch.manual_seed(args.seed)
+    policy = GNNPolicy()
+    if args.init:
+        policy.load_state_dict(torch.load(args.init, map_location="cpu"))
+    policy = policy.to(args.device)
+    optimizer = torch.optim.Adam(policy.parameters(), lr=args.lr)
+    buffer = ReplayBuffer(args.buffer_size, args.seed)
+    try:
+        steps = train_online(
+            policy, samples, buffer, optimizer, max_steps=args.max_steps, time_limit=args.time_limit,
+            min_samples=args.min_samples, batch_size=args.batch_size, checkpoint_every=args.checkpoint_every,
+            output=args.output, keep_checkpoints=args.keep_checkpoints, device=args.device,
+        )
+    finally:
+        stop.set()
+        # Unblock the collectors waiting on a full queue, then wait for the current node
+        buffer.drain(samples)
+        for process_ in collectors:
+            process_.join(timeout=30)
+            if process_.is_alive():
+                process_.terminate()
+    print(f"{steps} steps on {buffer.n_added} samples, parameters saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
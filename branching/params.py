@@ -0,0 +1,6 @@
+# We can pass custom SCIP parameters easily
+SCIP_PARAMETERS = {
+    "separating/maxrounds": 0,
+    "presolving/maxrestarts": 0,
+    "limits/time": 3600,
+}
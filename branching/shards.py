@@ -0,0 +1,70 @@
+import gzip
+import json
+import os
+import pickle
+
+
+def shard_path(out_dir, shard):
+    return os.path.join(out_dir, f"shard_{shard:03d}.pkl.gz")
+
+
+def shard_manifest_path(out_dir, shard):
+    return os.path.join(out_dir, f"shard_{shard:03d}.json")
+
+
+def write_json(path, data):
+    """
+    Write a JSON file atomically.
+    """
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def read_shard_manifest(out_dir, shard):
+    path = shard_manifest_path(out_dir, shard)
+    if not os.path.exists(path):
+        return {"offset": 0, "n_samples": 0, "instances": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def iter_samples(out_dir):
+    """
+    Yield the [node_observation, action, action_set, scores] samples of a collection run,
+    shard by shard, ignoring incomplete trailing data.
+    """
+    with open(os.path.join(out_dir, "manifest.json")) as f:
+        config = json.load(f)
+    for shard in range(config["n_workers"]):
+        manifest = read_shard_manifest(out_dir, shard)
+        if manifest["offset"] == 0:
+            continue
+        with open(shard_path(out_dir, shard), "rb") as raw:
+            with gzip.GzipFile(fileobj=_Limited(raw, manifest["offset"]), mode="rb") as f:
+                while True:
+                    try:
+                        yield pickle.load(f)
+                    except EOFError:
+                        break
+
+
+class _Limited(object):
+    """
+    Read-only file wrapper stopping at a given offset.
+    """
+
+    def __init__(self, file, limit):
+        self.file, self.limit = file, limit
+
+    def read(self, size=-1):
+        remaining = self.limit - self.file.tell()
+        if size < 0 or size > remaining:
+            size = remaining
+        return self.file.read(max(size, 0))
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
@@ -0,0 +1,24 @@
+import numpy as np
+import torch
+
+from inference import PolicyInference
+from model import GNNPolicy
+
+
+def test_embed_skips_unchanged_float64_rows():
+    torch.manual_seed(0)
+    engine = PolicyInference(GNNPolicy())
+    embedding = engine.policy.cons_embedding
+    # ecole NodeBipartite features are float64
+    features = np.random.default_rng(0).random((300, 5))
+
+    with torch.inference_mode():
+        engine._embed("constraints", features, embedding)
+        engine._embed("constraints", features.copy(), embedding)
+        assert engine.rows_embedded == 0
+
+        features[[3, 7, 250]] += 1.0
+        embedded = engine._embed("constraints", features, embedding)
+        assert engine.rows_embedded == 3
+        expected = embedding(torch.from_numpy(features.astype(np.float32)))
+        assert torch.allclose(embedded, expected, atol=1e-6)
@@ -0,0 +1,201 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torch_geometric
+
+from dataset import GraphDataset, PackedGraphDataset
+from model import GNNPolicy
+
+
+def pad_tensor(input_, pad_sizes, pad_value=-1e8):
+    """
+    This utility function splits a tensor and pads each split to make them all the same size, then stacks them.
+    """
+    max_pad_size = pad_sizes.max()
+    output = input_.split(pad_sizes.cpu().numpy().tolist())
+    output = torch.stack(
+        [
+            F.pad(slice_, (0, max_pad_size - slice_.size(0)), "constant", pad_value)
+            for slice_ in output
+        ],
+        dim=0,
+    )
+    return output
+
+
+class SizeBucketSampler(torch.utils.data.Sampler):
+    """
+    Batch sampler grouping samples of similar size. The shuffled samples are cut into pools
+    of pool_batches batches, every pool is sorted by (constraints, variables) and split into
+    batches, and the batches are shuffled. Batches then hold graphs (and candidate sets) of
+    close sizes, which keeps the padding of pad_tensor small.
+    """
+
+    def __init__(self, sizes, batch_size, shuffle=True, pool_batches=50, seed=0):
+        self.sizes = np.asarray(sizes)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pool_batches = pool_batches
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return (len(self.sizes) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        order = self.rng.permutation(len(self.sizes)) if self.shuffle else np.arange(len(self.sizes))
+        pool_size = self.batch_size * self.pool_batches
+        batches = []
+        for start in range(0, len(order), pool_size):
+            pool = order[start:start + pool_size]
+            pool = pool[np.lexsort((self.sizes[pool, 1], self.sizes[pool, 0]))]
+            batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+        if self.shuffle:
+            self.rng.shuffle(batches)
+        return iter([batch.tolist() for batch in batches])
+
+
+def make_loader(dataset, batch_size, shuffle=False, workers=0, prefetch_factor=4, pin_memory=False,
+                buckets=True, seed=0):
+    """
+    DataLoader loading and collating batches in background worker processes. Batches of a
+    PackedGraphDataset are bucketed by size unless buckets is False.
+    """
+    kwargs = {}
+    if workers > 0:
+        # Workers keep their memory maps and prefetch batches across epochs
+        kwargs.update(num_workers=workers, prefetch_factor=prefetch_factor, persistent_workers=True)
+    if buckets and hasattr(dataset, "sizes"):
+        sampler = SizeBucketSampler(dataset.sizes(), batch_size, shuffle=shuffle, seed=seed)
+        return torch_geometric.loader.DataLoader(dataset, batch_sampler=sampler, pin_memory=pin_memory, **kwargs)
+    return torch_geometric.loader.DataLoader(
+        dataset, batch_size=batch_size, shuffle=shuffle, pin_memory=pin_memory, **kwargs
+    )
+
+
+def process(policy, data_loader, optimizer=None, device="cpu"):
+    """
+    This function will process a whole epoch of training or validation, depending on whether an optimizer is provided.
+    Returns the mean loss and accuracy and the throughput statistics of the epoch.
+    """
+    mean_loss = 0
+    mean_acc = 0
+    wait_time = 0.0
+
+    n_samples_processed = 0
+    start = time.perf_counter()
+    with torch.set_grad_enabled(optimizer is not None):
+        batches = iter(data_loader)
+        while True:
+            # Time spent waiting for the loader, the rest of the epoch is model compute
+            wait_start = time.perf_counter()
+            batch = next(batches, None)
+            wait_time += time.perf_counter() - wait_start
+            if batch is None:
+                break
+            batch = batch.to(device, non_blocking=True)
+            # Compute the logits (i.e. pre-softmax activations) according to the policy on the concatenated graphs
+            logits = policy(
+                batch.constraint_features,
+                batch.edge_index,
+                batch.edge_attr,
+                batch.variable_features,
+            )
+            # Index the results by the candidates, and split and pad them
+            logits = pad_tensor(logits[batch.candidates], batch.nb_candidates)
+            # Compute the usual cross-entropy classification loss
+            loss = F.cross_entropy(logits, batch.candidate_choices)
+
+            if optimizer is not None:
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+
+            true_scores = pad_tensor(batch.candidate_scores, batch.nb_candidates)
+            true_bestscore = true_scores.max(dim=-1, keepdims=True).values
+
+            predicted_bestindex = logits.max(dim=-1, keepdims=True).indices
+            accuracy = (
+                (true_scores.gather(-1, predicted_bestindex) == true_bestscore)
+                .float()
+                .mean()
+                .item()
+            )
+
+            mean_loss += loss.item() * batch.num_graphs
+            mean_acc += accuracy * batch.num_graphs
+            n_samples_processed += batch.num_graphs
+
+    elapsed = time.perf_counter() - start
+    mean_loss /= n_samples_processed
+    mean_acc /= n_samples_processed
+    stats = {
+        "samples": n_samples_processed,
+        "time": elapsed,
+        "samples_per_second": n_samples_processed / elapsed,
+        "data_wait_fraction": wait_time / elapsed,
+    }
+    return mean_loss, mean_acc, stats
+
+
+def load_datasets(samples, valid_fraction, seed=0):
+    """
+    Train and validation datasets of a packed directory or a glob of sample_*.pkl files.
+    """
+    if os.path.isdir(samples):
+        n = PackedGraphDataset(samples).len()
+        order = np.random.default_rng(seed).permutation(n)
+        n_valid = int(valid_fraction * n)
+        return PackedGraphDataset(samples, order[n_valid:]), PackedGraphDataset(samples, order[:n_valid])
+    sample_files = sorted(glob.glob(samples))
+    n_train = len(sample_files) - int(valid_fraction * len(sample_files))
+    return GraphDataset(sample_files[:n_train]), GraphDataset(sample_files[n_train:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the GNN branching policy by imitation of strong branching.")
+    parser.add_argument("samples", help="packed dataset directory (see dataset.py) or glob of sample_*.pkl files")
+    parser.add_argument("--output", default="trained_params.pkl")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--valid-batch-size", type=int, default=128)
+    parser.add_argument("--valid-fraction", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count()), help="loader processes, 0 to load in the main process")
+    parser.add_argument("--prefetch-factor", type=int, default=4, help="batches prefetched by every worker")
+    parser.add_argument("--no-buckets", action="store_true", help="do not group the batches by graph size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    device = torch.device(args.device)
+    train_data, valid_data = load_datasets(args.samples, args.valid_fraction, args.seed)
+    # Pinned host buffers only pay off for asynchronous copies to a GPU
+    loader_args = dict(workers=args.workers, prefetch_factor=args.prefetch_factor,
+                       pin_memory=device.type == "cuda", buckets=not args.no_buckets, seed=args.seed)
+    train_loader = make_loader(train_data, args.batch_size, shuffle=True, **loader_args)
+    valid_loader = make_loader(valid_data, args.valid_batch_size, **loader_args)
+
+    policy = GNNPolicy().to(device)
+    optimizer = torch.optim.Adam(policy.parameters(), lr=args.lr)
+    for epoch in range(args.epochs):
+        print(f"Epoch {epoch+1}")
+
+        train_loss, train_acc, stats = process(policy, train_loader, optimizer, device)
+        print(f"Train loss: {train_loss:0.3f}, accuracy {train_acc:0.3f}"
+              f" | {stats['samples_per_second']:.1f} samples/s, {100 * stats['data_wait_fraction']:.1f}% waiting for data")
+
+        if len(valid_data):
+            valid_loss, valid_acc, _ = process(policy, valid_loader, None, device)
+            print(f"Valid loss: {valid_loss:0.3f}, accuracy {valid_acc:0.3f}")
+
+    torch.save(policy.state_dict(), args.output)
+
+
+if __name__ == "__main__":
+    main()
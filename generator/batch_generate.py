@@ -0,0 +1,205 @@
+import argparse
+import functools
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+# Centroid sets of the zoning_generator.py corpus
+DEFAULT_CENTROIDS = [[750, 830], [670, 593, 497, 723],
+                     [544, 569, 823], [664, 544, 750, 862],
+                     [664, 862, 722, 867], [544, 569, 823], [723, 456, 838, 497],
+                     [497, 456, 838, 507, 625, 830, 453], [722, 420, 575, 656, 603, 680, 723],
+                     [525, 823, 834, 801, 638, 490, 562, 872]]
+
+
+def parse_range(text):
+    """
+    Parse "0-99" or "1,3,5" into a list of ints.
+    """
+    values = []
+    for part in text.split(","):
+        if "-" in part[1:]:
+            lo, hi = part.split("-", 1)
+            values.extend(range(int(lo), int(hi) + 1))
+        else:
+            values.append(int(part))
+    return values
+
+
+def pseudo_tasks(args):
+    for n, m, capacity, seed in itertools.product(args.sizes, args.schools, args.capacity, parse_range(args.seeds)):
+        params = {"kind": "pseudo", "n": n, "m": m, "c_i": capacity, "s_j": args.max_students, "seed": seed}
+        # Keep the zone_pseudo_{n}_{seed} names expected by the notebooks for the default grid
+        name = f"zone_pseudo_{n}_{seed}"
+        if len(args.schools) > 1 or len(args.capacity) > 1:
+            name = f"zone_pseudo_{n}_{m}_{capacity}_{seed}"
+        yield params, os.path.join(args.out_dir, f"{name}.{args.format}")
+
+
+def zoning_tasks(args):
+    centroid_sets = [parse_range(text) for text in args.centroids] if args.centroids else DEFAULT_CENTROIDS
+    region = {}
+    if args.latitude is not None:
+        region["latitude"] = args.latitude
+    if args.bbox is not None:
+        region["bbox"] = [float(value) for value in args.bbox.split(",")]
+    for i, centroids in enumerate(centroid_sets):
+        params = {"kind": "zoning", "centroids": centroids}
+        if region:
+            params["region"] = region
+        yield params, os.path.join(args.out_dir, f"school_zoning_{i}.{args.format}")
+
+
+def region_blocks(region):
+    """
+    Census blocks of the tracts selected by a region: tract centroids north of a latitude
+    and/or inside a [min_lon, min_lat, max_lon, max_lat] bounding box.
+    """
+    from partial_map import load_spatial_layer
+    layer = load_spatial_layer()
+    tracts = layer.tracts
+    if "latitude" in region:
+        tracts = np.intersect1d(tracts, layer.tracts_above_latitude(region["latitude"]))
+    if "bbox" in region:
+        tracts = np.intersect1d(tracts, layer.tracts_in_bbox(*region["bbox"]))
+    return layer.blocks(tracts)
+
+
+def centroids_outside(centroids, blocks):
+    """
+    Centroid school ids whose block is not among the given census blocks.
+    """
+    from data_store import load_zoning_data
+    school_blocks = load_zoning_data().schools.set_index('school_id')['Block']
+    blocks = set(np.asarray(blocks, dtype=np.int64).tolist())
+    return [school for school in centroids
+            if school in school_blocks.index and int(school_blocks[school]) not in blocks]
+
+
+def meta_path(path):
+    return path + ".json"
+
+
+def is_up_to_date(params, path):
+    """
+    An instance is skipped when it exists and was generated with the same parameters.
+    """
+    if not (os.path.exists(path) and os.path.exists(meta_path(path))):
+        return False
+    with open(meta_path(path)) as f:
+        return json.load(f) == params
+
+
+def profile_path(path):
+    return path + ".profile.json"
+
+
+def generate(task, profile=False, cprofile=False):
+    """
+    Generate one instance and write it atomically (temporary file, then rename). With
+    profile=True the generation profile is written next to it (<path>.profile.json), with
+    cprofile=True the cProfile statistics as well (<path>.prof).
+    """
+    from profiling import GenerationProfile
+
+    params, path = task
+    start = time.time()
+    generation_profile = GenerationProfile(os.path.basename(path), cprofile=cprofile)
+    if params["kind"] == "pseudo":
+        from pseudo_data_gen import SchoolZoning
+        school_zoning = SchoolZoning(
+            n=params["n"], m=params["m"], c_i=params["c_i"], s_j=params["s_j"], seed=params["seed"],
+            profile=generation_profile, compact=params.get("compact", False),
+        )
+    else:
+        from zoning_generator import SchoolZoning
+        school_zoning = SchoolZoning(
+            centroids=params["centroids"], profile=generation_profile, compact=params.get("compact", False),
+            blocks=region_blocks(params["region"]) if "region" in params else None,
+        )
+    school_zoning.add_objective()
+    school_zoning.add_feasibility_constraints()
+    school_zoning.add_balancing_constraints()
+
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".tmp-{os.getpid()}-{name}")
+    school_zoning.write(tmp_path, name=name.split(".")[0])
+    os.replace(tmp_path, path)
+    with open(meta_path(tmp_path), "w") as f:
+        json.dump(params, f)
+    os.replace(meta_path(tmp_path), meta_path(path))
+    if profile or cprofile:
+        generation_profile.write(profile_path(path))
+    if cprofile:
+        generation_profile.dump_stats(path + ".prof")
+    return path, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate school zoning instances in parallel.")
+    parser.add_argument("--out-dir", default="lp_test_files")
+    parser.add_argument("--format", default="lp", help="lp, mps, npz, lp.gz or mps.gz")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--compact", action="store_true", help="one b variable per undirected neighboring edge")
+    parser.add_argument("--profile", action="store_true", help="write <instance>.profile.json phase timings")
+    parser.add_argument("--cprofile", action="store_true", help="also run under cProfile and write <instance>.prof")
+    subparsers = parser.add_subparsers(dest="kind", required=True)
+
+    pseudo = subparsers.add_parser("pseudo", help="random grid instances")
+    pseudo.add_argument("--sizes", type=int, nargs="+", default=[6], help="grid sizes n (n x n zones)")
+    pseudo.add_argument("--schools", type=int, nargs="+", default=[6], help="number of schools")
+    pseudo.add_argument("--capacity", type=int, nargs="+", default=[30], help="capacity of each school")
+    pseudo.add_argument("--max-students", type=int, default=5, help="maximum number of students per zone")
+    pseudo.add_argument("--seeds", default="0-99", help="seeds, e.g. 0-99 or 1,2,3")
+
+    zoning = subparsers.add_parser("zoning", help="San Francisco instances for given centroid sets")
+    zoning.add_argument("--centroids", nargs="+", help="centroid school ids per instance, e.g. 750,830")
+    zoning.add_argument("--latitude", type=float, help="only keep the tracts north of this latitude")
+    zoning.add_argument("--bbox", help="only keep the tracts centered in min_lon,min_lat,max_lon,max_lat")
+
+    args = parser.parse_args()
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    tasks = list(pseudo_tasks(args) if args.kind == "pseudo" else zoning_tasks(args))
+    if args.compact:
+        for params, _ in tasks:
+            params["compact"] = True
+    todo = [(params, path) for params, path in tasks if not is_up_to_date(params, path)]
+    print(f"{len(tasks) - len(todo)} instances up to date, generating {len(todo)}")
+    if not todo:
+        return
+
+    if args.kind == "zoning":
+        # Load the preprocessed inputs once, the forked workers share them copy-on-write
+        from data_store import load_zoning_data
+        load_zoning_data()
+        if args.latitude is not None or args.bbox is not None:
+            from partial_map import load_spatial_layer
+            load_spatial_layer()
+            # A centroid outside the region has no unit to anchor its zone
+            blocks = region_blocks(todo[0][0]["region"])
+            kept = []
+            for params, path in todo:
+                outside = centroids_outside(params["centroids"], blocks)
+                if outside:
+                    print(f"Skipping {path}: centroids {outside} are outside the region")
+                else:
+                    kept.append((params, path))
+            todo = kept
+            if not todo:
+                return
+
+    start = time.time()
+    with multiprocessing.get_context("fork").Pool(min(args.workers, len(todo))) as pool:
+        worker = functools.partial(generate, profile=args.profile, cprofile=args.cprofile)
+        for path, seconds in pool.imap_unordered(worker, todo):
+            print(f"{path} written in {seconds:.2f}s")
+    print(f"{len(todo)} instances in {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
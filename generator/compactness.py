@@ -0,0 +1,160 @@
+import argparse
+import time
+
+import numpy as np
+from pyscipopt import Conshdlr, SCIP_PARAMSETTING, SCIP_RESULT
+
+# Tolerance on x_u_z - x_v_z - b_uv above which a compactness row is violated
+VIOLATION_TOLERANCE = 1e-6
+
+
+class CompactnessHandler(Conshdlr):
+    """
+    Enforce the compactness rows x_u_z - x_v_z - b_uv <= 0 and x_u_z - x_v_z + b_uv >= 0
+    lazily: only the rows violated by an LP or candidate solution are added to the model.
+    """
+
+    def __init__(self, x, b, pair_u, pair_v):
+        # x: (units, Z) array of x variables, b: b variable of every pair
+        self.x, self.b = x, b
+        self.pair_u, self.pair_v = pair_u, pair_v
+        self.added = set()
+
+    def violations(self, solution=None):
+        """
+        (pair, zone, direction) of the violated rows, direction +1 for x_u - x_v <= b and
+        -1 for x_v - x_u <= b.
+        """
+        get = self.model.getSolVal
+        x = np.array([get(solution, var) for var in self.x.ravel()]).reshape(self.x.shape)
+        b = np.array([get(solution, var) for var in self.b])
+        diff = x[self.pair_u] - x[self.pair_v]
+        excess = np.stack([diff, -diff], axis=-1) - b[:, None, None]
+        pair, zone, side = np.nonzero(excess > VIOLATION_TOLERANCE)
+        return pair, zone, 1 - 2 * side
+
+    def add_violated(self, solution=None):
+        added = 0
+        for pair, zone, direction in zip(*self.violations(solution)):
+            key = (int(pair), int(zone), int(direction))
+            if key in self.added:
+                continue
+            self.added.add(key)
+            u, v = self.pair_u[pair], self.pair_v[pair]
+            self.model.addCons(
+                direction * (self.x[u, zone] - self.x[v, zone]) - self.b[pair] <= 0,
+                name=f"compactness_{pair}_{zone}_{'p' if direction > 0 else 'n'}",
+            )
+            added += 1
+        return added
+
+    def conscheck(self, constraints, solution, checkintegrality, checklprows, printreason, completely):
+        if len(self.violations(solution)[0]):
+            return {"result": SCIP_RESULT.INFEASIBLE}
+        return {"result": SCIP_RESULT.FEASIBLE}
+
+    def consenfolp(self, constraints, nusefulconss, solinfeasible):
+        if self.add_violated():
+            return {"result": SCIP_RESULT.CONSADDED}
+        return {"result": SCIP_RESULT.FEASIBLE}
+
+    def consenfops(self, constraints, nusefulconss, solinfeasible, objinfeasible):
+        if self.add_violated():
+            return {"result": SCIP_RESULT.CONSADDED}
+        return {"result": SCIP_RESULT.FEASIBLE}
+
+    def conslock(self, constraint, locktype, nlockspos, nlocksneg):
+        # x appears with both signs, b only on the side where decreasing it is infeasible
+        for var in self.x.ravel():
+            self.model.addVarLocksType(var, locktype, nlockspos + nlocksneg, nlockspos + nlocksneg)
+        for var in self.b:
+            self.model.addVarLocksType(var, locktype, nlockspos, nlocksneg)
+
+
+def include_compactness_handler(scip, x, b, pair_u, pair_v):
+    """
+    Add a CompactnessHandler to a pyscipopt.Model built without the compactness rows.
+    """
+    handler = CompactnessHandler(x, b, pair_u, pair_v)
+    # Symmetry handling only sees the explicit rows, the lazy ones would be cut off
+    scip.setParam("misc/usesymmetry", 0)
+    scip.includeConshdlr(
+        handler, "compactness", "lazy school zoning compactness rows",
+        enfopriority=-10, chckpriority=-10, needscons=False,
+    )
+    return handler
+
+
+def root_lp(scip):
+    """
+    Solve only the root LP relaxation of a pyscipopt.Model (no presolving, cuts or
+    heuristics or symmetry detection). Returns (root LP bound, LP iterations, seconds).
+    """
+    scip.setPresolve(SCIP_PARAMSETTING.OFF)
+    scip.setSeparating(SCIP_PARAMSETTING.OFF)
+    scip.setHeuristics(SCIP_PARAMSETTING.OFF)
+    scip.setParam("limits/nodes", 1)
+    scip.setParam("misc/usesymmetry", 0)
+    scip.hideOutput()
+    start = time.perf_counter()
+    scip.optimize()
+    return scip.getDualboundRoot(), scip.getNLPIterations(), time.perf_counter() - start
+
+
+def solve(scip, time_limit=None):
+    scip.hideOutput()
+    if time_limit is not None:
+        scip.setParam("limits/time", time_limit)
+    start = time.perf_counter()
+    scip.optimize()
+    return scip.getObjVal(), time.perf_counter() - start
+
+
+def compare_formulations(make_instance, time_limit=None):
+    """
+    Build and solve an instance in the default formulation, the compact formulation and
+    the compact formulation with lazy compactness rows. make_instance(compact) returns a
+    ZoningModel. Returns one result dict per formulation.
+    """
+    results = []
+    for name, compact, lazy in (("default", False, False), ("compact", True, False), ("lazy", True, True)):
+        zoning = make_instance(compact)
+        zoning.add_objective()
+        zoning.add_feasibility_constraints(lazy_compactness=lazy)
+        zoning.add_balancing_constraints()
+        result = {"formulation": name, "variables": zoning.model.n_vars,
+                  "rows": zoning.model.n_rows, "nnz": zoning.model.nnz}
+        result["root_bound"], result["root_lp_iterations"], result["root_lp_time"] = root_lp(zoning.build_model())
+        scip = zoning.build_model()
+        result["objective"], result["time"] = solve(scip, time_limit)
+        if lazy:
+            result["lazy_rows"] = len(zoning.compactness_handler.added)
+        results.append(result)
+    return results
+
+
+def main():
+    from pseudo_data_gen import SchoolZoning
+
+    parser = argparse.ArgumentParser(description="Compare the default and compact compactness formulations.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[6, 8])
+    parser.add_argument("--seeds", type=int, default=3, help="instances (seeds 0..N-1) per size")
+    parser.add_argument("--time-limit", type=float, default=None)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        for seed in range(args.seeds):
+            results = compare_formulations(
+                lambda compact: SchoolZoning(n=n, seed=seed, compact=compact), args.time_limit
+            )
+            for result in results:
+                print(f"n={n} seed={seed} {result['formulation']: <8} | rows {result['rows']: >7}"
+                      f" | nnz {result['nnz']: >8} | objective {result['objective']: >8.1f}"
+                      f" | root LP {result['root_lp_iterations']: >6} it {result['root_lp_time']: >7.3f}s | solve {result['time']: >8.2f}s")
+            objectives = {round(result["objective"], 6) for result in results}
+            if len(objectives) > 1 and args.time_limit is None:
+                raise ValueError(f"Formulations disagree on n={n} seed={seed}: {objectives}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import warnings
+
+import numpy as np
+
+
+class ContiguityIndex(object):
+    """
+    Precomputed index for the contiguity constraints.
+
+    Units are identified by their position 0..n-1 in unit_ids. The neighbors are stored as
+    a CSR structure (indptr, indices) and the distances from each centroid to every unit
+    are dense float32 rows (NaN when the distance is unknown), computed once per centroid
+    and reused across zone configurations.
+    """
+
+    def __init__(self, unit_ids, neighbor_dict, distance_row):
+        """
+        unit_ids: unit ids in position order
+        neighbor_dict: unit id -> iterable of neighboring unit ids
+        distance_row: function mapping a centroid id to the distances from that centroid
+            to every unit, aligned with unit_ids
+        """
+        self.unit_ids = list(unit_ids)
+        self.position = {unit: i for i, unit in enumerate(self.unit_ids)}
+        self.distance_row = distance_row
+        self.rows = {}
+
+        indptr, indices = [0], []
+        for unit in self.unit_ids:
+            indices.extend(self.position[v] for v in neighbor_dict.get(unit, ()) if v in self.position)
+            indptr.append(len(indices))
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        # Source unit of every neighbor entry
+        self.sources = np.repeat(np.arange(len(self.unit_ids)), np.diff(self.indptr))
+
+    def distances(self, centroid):
+        """
+        Distances from a centroid to every unit as a float32 array.
+        """
+        if centroid not in self.rows:
+            row = np.asarray(self.distance_row(centroid), dtype=np.float32)
+            missing = np.isnan(row)
+            if missing.any():
+                ids = [self.unit_ids[i] for i in np.flatnonzero(missing)[:5]]
+                warnings.warn(
+                    f"{missing.sum()} units have no distance to centroid {centroid} "
+                    f"(e.g. {ids}), their contiguity terms are skipped"
+                )
+            self.rows[centroid] = row
+        return self.rows[centroid]
+
+    def closer_than_centroid(self, centroids):
+        """
+        Boolean (Z, nnz) mask: neighbor v of u is at most as far from centroid z as u is.
+        """
+        dist = np.stack([self.distances(centroid) for centroid in centroids])
+        return dist[:, self.indices] <= dist[:, self.sources]
+
+    def contiguity_terms(self, centroids):
+        """
+        (u, z, v) arrays of the neighbors v of u closer to centroid z than u, sorted by u then z.
+        """
+        z, edge = np.nonzero(self.closer_than_centroid(centroids))
+        u, v = self.sources[edge], self.indices[edge]
+        order = np.lexsort((z, u))
+        return u[order], z[order], v[order]
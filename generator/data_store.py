@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = "data"
+# Bump when the layout of the cache changes
+CACHE_VERSION = 2
+# Rows of the distance CSV parsed at a time during ingest
+DISTANCE_CHUNK_ROWS = 512
+
+SOURCES = {
+    "area": "area_data.csv",
+    "adjacency": "block_adjacency_matrix.csv",
+    "distances": "distances_b2b.csv",
+    "schools": "schools_rehauled_2324.csv",
+}
+
+# Stores already loaded in this process, keyed by data directory
+_STORES = {}
+
+
+def file_hash(path, chunk_size=1 << 24):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ZoningData(object):
+    """
+    Preprocessed census inputs of SchoolZoning:
+        area_data: deduplicated area DataFrame with its 1-based 'index' column
+        schools: school DataFrame
+        adjacency_blocks, adjacency_indptr, adjacency_indices: block adjacency as CSR over
+            the block ids of the adjacency file
+        distance_blocks, distance_columns, distances: block-to-block distance matrix
+            (row-major, memory-mapped float32) with the block ids of its rows and columns
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.area_data = pd.read_pickle(os.path.join(cache_path, "area.pkl"))
+        self.schools = pd.read_pickle(os.path.join(cache_path, "schools.pkl"))
+        with np.load(os.path.join(cache_path, "adjacency.npz")) as adjacency:
+            self.adjacency_blocks = adjacency["blocks"]
+            self.adjacency_indptr = adjacency["indptr"]
+            self.adjacency_indices = adjacency["indices"]
+        with np.load(os.path.join(cache_path, "distance_index.npz")) as index:
+            self.distance_blocks = index["rows"]
+            self.distance_columns = index["columns"]
+        self.distances = np.load(os.path.join(cache_path, "distances.npy"), mmap_mode="r")
+        self.distance_row_index = pd.Index(self.distance_blocks)
+        self.distance_column_index = pd.Index(self.distance_columns)
+
+    def centroid_distances(self, centroids, blocks):
+        """
+        (len(centroids), len(blocks)) float32 array of distances from each centroid to each
+        block, NaN when the block is not in the distance matrix. Only the centroid rows of
+        the memory-mapped matrix are read.
+        """
+        rows = self.distance_row_index.get_indexer([int(centroid) for centroid in centroids])
+        if (rows < 0).any():
+            missing = [centroid for centroid, row in zip(centroids, rows) if row < 0]
+            raise KeyError(f"No distances for centroids {missing}")
+        columns = self.distance_column_index.get_indexer(np.asarray(blocks).astype(np.int64))
+        cent_dist = np.take(self.distances, rows, axis=0)
+        cent_dist = np.where(columns >= 0, cent_dist[:, np.maximum(columns, 0)], np.nan)
+        return cent_dist.astype(np.float32)
+
+    def neighbor_pairs_and_dict(self):
+        """
+        Neighboring pairs and neighbor lists, as returned by generate_neighboring_pairs_and_dict.
+        """
+        blocks = self.adjacency_blocks.tolist()
+        indices = self.adjacency_indices.tolist()
+        indptr = self.adjacency_indptr.tolist()
+        neighbor_dict = {block: indices[indptr[i]:indptr[i + 1]] for i, block in enumerate(blocks)}
+        pairs = {(block, v) for block, values in neighbor_dict.items() for v in values}
+        return pairs, neighbor_dict
+
+
+def _ingest(data_dir, cache_path):
+    """
+    Convert the CSV inputs into the cache layout read by ZoningData. The cache is built in
+    a directory private to the process and moved into place once complete; when another
+    process finished the same cache first, its copy is kept.
+    """
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    try:
+        _ingest_files(data_dir, tmp_path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Renaming onto the non-empty directory of a concurrent ingest fails
+        if not os.path.exists(cache_path):
+            raise
+        shutil.rmtree(tmp_path)
+
+
+def _ingest_files(data_dir, tmp_path):
+    # There exists a few duplicated census blocks, we remove them
+    area_data = pd.read_csv(os.path.join(data_dir, SOURCES["area"]))
+    area_data = area_data.drop_duplicates(subset='census_block')
+    area_data['index'] = range(1, len(area_data) + 1)
+    area_data.to_pickle(os.path.join(tmp_path, "area.pkl"))
+
+    pd.read_csv(os.path.join(data_dir, SOURCES["schools"])).to_pickle(os.path.join(tmp_path, "schools.pkl"))
+
+    # The first column of each row is a block, the other non empty columns its neighbors
+    adjacency = pd.read_csv(os.path.join(data_dir, SOURCES["adjacency"])).to_numpy(dtype=np.float64)
+    present = ~np.isnan(adjacency[:, 1:])
+    np.savez(
+        os.path.join(tmp_path, "adjacency.npz"),
+        blocks=adjacency[:, 0].astype(np.int64),
+        indptr=np.concatenate(([0], np.cumsum(present.sum(axis=1)))),
+        indices=adjacency[:, 1:][present].astype(np.int64),
+    )
+
+    _ingest_distances(os.path.join(data_dir, SOURCES["distances"]), tmp_path)
+
+
+def _ingest_distances(path, cache_path, chunk_rows=DISTANCE_CHUNK_ROWS):
+    """
+    Stream the block-to-block distance CSV into a row-major float32 .npy file, chunk by
+    chunk, so the full matrix never has to fit in memory.
+    """
+    columns = pd.read_csv(path, nrows=0).columns
+    block_columns = columns.drop('Block')
+    # Row count of the rows pandas parses (a missing final newline or blank lines included)
+    n_rows = sum(len(chunk) for chunk in pd.read_csv(path, usecols=['Block'], chunksize=1 << 16))
+
+    distances = np.lib.format.open_memmap(
+        os.path.join(cache_path, "distances.npy"), mode="w+", dtype=np.float32,
+        shape=(n_rows, len(block_columns))
+    )
+    dtypes = {column: np.float32 for column in block_columns}
+    dtypes['Block'] = np.int64
+    rows, start = [], 0
+    for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=dtypes):
+        rows.append(chunk['Block'].to_numpy())
+        distances[start:start + len(chunk)] = chunk[block_columns].to_numpy()
+        start += len(chunk)
+    distances.flush()
+    del distances
+
+    np.savez(
+        os.path.join(cache_path, "distance_index.npz"),
+        rows=np.concatenate(rows)[:start],
+        columns=block_columns.astype(np.float64).astype(np.int64).to_numpy(),
+    )
+
+
+def _source_hashes(data_dir, cache_dir, sources=SOURCES):
+    """
+    Hash of every source file. Hashes are remembered with the file size and modification
+    time in cache_dir/sources.json so unchanged files are not re-read.
+    """
+    known_path = os.path.join(cache_dir, "sources.json")
+    known = {}
+    if os.path.exists(known_path):
+        with open(known_path) as f:
+            known = json.load(f)
+
+    hashes = {}
+    for name, file_name in sources.items():
+        path = os.path.join(data_dir, file_name)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        entry = known.get(path)
+        if entry is None or entry["signature"] != signature:
+            entry = {"signature": signature, "sha1": file_hash(path)}
+            known[path] = entry
+        hashes[name] = entry["sha1"]
+
+    tmp_path = f"{known_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(known, f)
+    os.replace(tmp_path, known_path)
+    return hashes
+
+
+def load_zoning_data(data_dir=DATA_DIR, cache_dir=None):
+    """
+    Return the ZoningData for data_dir. The CSV inputs are converted once into a cache
+    directory (data_dir/cache by default) keyed by their hashes, and the loaded data is
+    shared by every caller in the process.
+    """
+    key = os.path.abspath(data_dir)
+    if key in _STORES:
+        return _STORES[key]
+
+    cache_dir = os.path.join(data_dir, "cache") if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    hashes = _source_hashes(data_dir, cache_dir)
+    digest = hashlib.sha1(json.dumps([CACHE_VERSION, hashes], sort_keys=True).encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f"v{CACHE_VERSION}_{digest[:16]}")
+    if not os.path.exists(cache_path):
+        print("Building preprocessing cache", cache_path)
+        _ingest(data_dir, cache_path)
+
+    _STORES[key] = ZoningData(cache_path)
+    return _STORES[key]
@@ -0,0 +1,345 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from contiguity import ContiguityIndex
+from data_store import DATA_DIR
+from zoning_model import ZoningModel
+
+# Block -> tract translation table used to coarsen the real instances
+TRACT_TABLE_PATH = os.path.join(DATA_DIR, "block_blockgroup_tract.csv")
+
+
+def tract_groups(zoning, path=TRACT_TABLE_PATH):
+    """
+    Tract of every unit of a real SchoolZoning instance. Blocks without a tract are
+    kept as their own group.
+    """
+    table = pd.read_csv(path).dropna(subset=["Block", "Tract"])
+    tract_of = dict(zip(table["Block"].astype(np.int64), table["Tract"].astype(np.int64)))
+    blocks = zoning.area_data["census_block"].astype(np.int64).tolist()
+    # Negative ids cannot clash with tract ids
+    return np.array([tract_of.get(block, -1 - i) for i, block in enumerate(blocks)], dtype=np.int64)
+
+
+def tile_groups(n, tile):
+    """
+    Group of every zone of an n x n pseudo grid: square tiles of tile x tile zones.
+    """
+    zone = np.arange(n**2)
+    return (zone // n // tile) * ((n + tile - 1) // tile) + (zone % n) // tile
+
+
+class CoarseZoning(ZoningModel):
+    """
+    Zoning instance over super-units, the groups of units of a fine instance. Counts are
+    summed per group, the neighboring pairs crossing two groups become weighted edges
+    (so the objective of a coarse solution is the one of the fine assignment it induces)
+    and the distance from a centroid to a group is its distance to the closest unit.
+    Centroid units are split off into groups of their own, so that two centroids never
+    share a group.
+    """
+
+    def __init__(self, fine, groups, profile=None):
+        self.init_profile(profile)
+        self.fine = fine
+        self.file = None
+        groups = np.array(groups, dtype=np.int64)
+        centroids = [fine.contiguity.position[centroid] for centroid in fine.centroids]
+        groups[centroids] = groups.max() + 1 + np.arange(len(centroids))
+        self.group_ids, self.unit_group = np.unique(groups, return_inverse=True)
+        n_groups = len(self.group_ids)
+
+        self.labels = self.group_ids
+        self.students = np.bincount(self.unit_group, weights=fine.students, minlength=n_groups).astype(np.int64)
+        self.seats = np.bincount(self.unit_group, weights=fine.seats, minlength=n_groups).astype(np.int64)
+        self.schools = np.bincount(self.unit_group, weights=fine.schools, minlength=n_groups).astype(np.int64)
+
+        u, v = self.unit_group[fine.pair_u], self.unit_group[fine.pair_v]
+        cross = u != v
+        weight = fine.pair_weight[cross].astype(np.int64)
+        self.pair_u, self.pair_v = np.repeat(u[cross], weight), np.repeat(v[cross], weight)
+        # The repeated pairs are merged into edges weighted by their number
+        self.compact = True
+
+        self.Z, self.SCH, self.centroids = fine.Z, fine.SCH, fine.centroids
+        neighbor_dict = {}
+        for a, b in zip(self.group_ids[u[cross]].tolist(), self.group_ids[v[cross]].tolist()):
+            neighbor_dict.setdefault(a, set()).add(b)
+        self.contiguity = ContiguityIndex(self.group_ids, neighbor_dict, self.group_distances)
+        self.init_model()
+
+    def group_distances(self, centroid):
+        distances = np.full(len(self.group_ids), np.nan)
+        np.fmin.at(distances, self.unit_group, self.fine.contiguity.distances(centroid))
+        return distances
+
+
+def assignment_values(zoning, zones):
+    """
+    Column values of the fine model for an assignment (zone of every unit).
+    """
+    n = len(zoning.labels)
+    values = np.zeros(zoning.model.n_vars)
+    values[zoning.x_index(np.arange(n), zones)] = 1.0
+    values[zoning.b_start + np.arange(len(zoning.pair_u))] = zones[zoning.pair_u] != zones[zoning.pair_v]
+    return values
+
+
+def neighbors_within(contiguity, units, rings):
+    """
+    Mask of the units at most rings neighbor hops away from the units of the mask.
+    """
+    units = units.copy()
+    for _ in range(rings):
+        reached = np.zeros_like(units)
+        reached[contiguity.indices[units[contiguity.sources]]] = True
+        units |= reached
+    return units
+
+
+def split_regions(contiguity, free, max_units):
+    """
+    Split the free units into connected regions of at most max_units units (breadth first).
+    Returns the region of every unit, -1 for the fixed ones.
+    """
+    region = np.full(len(free), -1, dtype=np.int64)
+    indptr, indices = contiguity.indptr, contiguity.indices
+    n_regions = 0
+    for seed in np.flatnonzero(free):
+        if region[seed] >= 0:
+            continue
+        queue, size = [seed], 0
+        region[seed] = n_regions
+        while queue and size < max_units:
+            unit = queue.pop(0)
+            size += 1
+            for neighbor in indices[indptr[unit]:indptr[unit + 1]]:
+                if free[neighbor] and region[neighbor] < 0 and size + len(queue) < max_units:
+                    region[neighbor] = n_regions
+                    queue.append(neighbor)
+        n_regions += 1
+    return region
+
+
+def color_regions(contiguity, region):
+    """
+    Greedy coloring of the regions such that regions of one color are not adjacent.
+    """
+    n_regions = region.max() + 1
+    a, b = region[contiguity.sources], region[contiguity.indices]
+    touching = (a >= 0) & (b >= 0) & (a != b)
+    adjacent = [set() for _ in range(n_regions)]
+    for r, s in zip(a[touching].tolist(), b[touching].tolist()):
+        adjacent[r].add(s)
+    colors = np.full(n_regions, -1, dtype=np.int64)
+    for r in range(n_regions):
+        used = {colors[s] for s in adjacent[r]}
+        colors[r] = next(c for c in range(n_regions) if c not in used)
+    return colors
+
+
+def solve_region(task):
+    """
+    Solve a restricted model, starting from the incumbent values of its columns. Returns
+    the values of its columns, or None when no solution was found.
+    """
+    model, start, time_limit = task
+    scip = model.to_scip("region")
+    scip.hideOutput()
+    scip.setParam("limits/time", time_limit)
+    variables = scip.getVars()
+    solution = scip.createSol()
+    for var, value in zip(variables, start.tolist()):
+        scip.setSolVal(solution, var, value)
+    scip.addSol(solution)
+    scip.optimize()
+    if scip.getNSols() == 0:
+        return None
+    best = scip.getBestSol()
+    return np.array([scip.getSolVal(best, var) for var in variables])
+
+
+def refine(zoning, zones, rings=1, max_region_units=200, rounds=2, time_limit=60, workers=None):
+    """
+    Improve (or repair) a fine assignment by re-solving the regions around the zone
+    boundaries with every other unit fixed. Non-adjacent regions are solved in parallel;
+    the slack of the rows they share (the balancing rows) is split between them so that
+    their solutions can be combined. Rows violated by a projected assignment are kept at
+    their violation, so the rounds never make the assignment less feasible. Returns the new assignment and per round statistics.
+    """
+    n, model = len(zoning.labels), zoning.model
+    contiguity = zoning.contiguity
+    pair_of_unit = [zoning.pair_u, zoning.pair_v]
+    history = []
+    # The rows never change, they are stacked once for all the regions
+    index = model.row_index()
+
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        for round_ in range(rounds):
+            start = time.time()
+            values = assignment_values(zoning, zones)
+            previous = zones.copy()
+            boundary = np.zeros(n, dtype=bool)
+            cut = zones[contiguity.sources] != zones[contiguity.indices]
+            boundary[contiguity.sources[cut]] = True
+            free = neighbors_within(contiguity, boundary, rings)
+            region = split_regions(contiguity, free, max_region_units)
+            if not free.any():
+                break
+            colors = color_regions(contiguity, region)
+
+            for color in range(colors.max() + 1):
+                values = assignment_values(zoning, zones)
+                slack = model.row_slack(values, index)
+                tasks, masks = [], []
+                for r in np.flatnonzero(colors == color):
+                    units = region == r
+                    mask = np.zeros(model.n_vars, dtype=bool)
+                    mask[zoning.x_index(np.flatnonzero(units)[:, None], np.arange(zoning.Z))] = True
+                    touched = units[pair_of_unit[0]] | units[pair_of_unit[1]]
+                    mask[zoning.b_start + np.flatnonzero(touched)] = True
+                    masks.append(mask)
+
+                # Rows shared by several regions of the batch get an equal share of their slack,
+                # rows the incumbent violates may not get any worse in any region
+                region_rows = [model.rows_of_columns(np.flatnonzero(mask), index) for mask in masks]
+                shared = np.bincount(np.concatenate(region_rows), minlength=model.n_rows)
+                tighten = np.where(slack < 0, slack, slack * (shared - 1) / np.maximum(shared, 1))
+                for mask in masks:
+                    sub, columns, _ = model.restrict(mask, values, tighten, index)
+                    tasks.append((sub, values[columns], time_limit))
+
+                for mask, result in zip(masks, pool.map(solve_region, tasks)):
+                    if result is not None:
+                        values[np.flatnonzero(mask)] = np.round(result)
+                x = values[zoning.x_start:zoning.x_start + n * zoning.Z].reshape(n, zoning.Z)
+                zones = x.argmax(axis=1)
+
+            values = assignment_values(zoning, zones)
+            history.append({
+                "round": round_, "free_units": int(free.sum()), "regions": int(region.max() + 1),
+                "colors": int(colors.max() + 1), "objective": model.objective_value(values),
+                "violated_rows": int((model.row_slack(values, index) < -1e-6).sum()), "time": time.time() - start,
+            })
+            print(f"Round {round_}: {history[-1]}")
+            if np.array_equal(zones, previous):
+                break
+    return zones, history
+
+
+def decompose(zoning, groups, coarse_time_limit=600, **refine_args):
+    """
+    Decomposition solve of a ZoningModel: solve the zoning of the super-units given by
+    groups (one group id per unit), project it on the units and refine the boundaries
+    with local MILPs (see refine). Returns (assignment, report).
+    """
+    if zoning.model.n_rows == 0:
+        zoning.add_objective()
+        zoning.add_feasibility_constraints()
+        zoning.add_balancing_constraints()
+
+    start = time.time()
+    coarse = CoarseZoning(zoning, groups)
+    scip = coarse.build_model()
+    scip.hideOutput()
+    scip.setParam("limits/time", coarse_time_limit)
+    scip.optimize()
+    if scip.getNSols() == 0:
+        raise ValueError(f"No solution of the coarse model ({scip.getStatus()})")
+    zones = coarse.assignment(scip)[coarse.unit_group]
+    values = assignment_values(zoning, zones)
+    report = {
+        "units": len(zoning.labels), "groups": len(coarse.group_ids),
+        "coarse_status": scip.getStatus(), "coarse_objective": scip.getObjVal(),
+        "coarse_time": time.time() - start,
+        "projected_objective": zoning.model.objective_value(values),
+        "projected_violated_rows": int((zoning.model.row_slack(values) < -1e-6).sum()),
+    }
+
+    zones, report["rounds"] = refine(zoning, zones, **refine_args)
+    values = assignment_values(zoning, zones)
+    report["objective"] = zoning.model.objective_value(values)
+    report["violated_rows"] = int((zoning.model.row_slack(values) < -1e-6).sum())
+    report["time"] = time.time() - start
+    return zones, report
+
+
+def compare_with_monolithic(zoning, report, time_limit=3600):
+    """
+    Solve the monolithic model and add its result to the report. The gap of the
+    decomposition to the monolithic optimum is only reported when the monolithic solve
+    finishes (gap); the gap to its dual bound is always reported (bound_gap).
+    """
+    scip = zoning.build_model()
+    scip.hideOutput()
+    scip.setParam("limits/time", time_limit)
+    start = time.time()
+    scip.optimize()
+    report["monolithic_status"] = scip.getStatus()
+    report["monolithic_time"] = time.time() - start
+    report["monolithic_bound"] = bound = scip.getDualbound()
+    report["bound_gap"] = (report["objective"] - bound) / max(abs(bound), 1e-9)
+    if scip.getNSols() > 0:
+        report["monolithic_objective"] = scip.getObjVal()
+    if scip.getStatus() == "optimal":
+        report["gap"] = (report["objective"] - scip.getObjVal()) / max(abs(scip.getObjVal()), 1e-9)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decomposition solve of a school zoning instance.")
+    parser.add_argument("--rings", type=int, default=1, help="neighbor rings around the zone boundaries")
+    parser.add_argument("--max-region-units", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--time-limit", type=float, default=60, help="time limit of every local MILP")
+    parser.add_argument("--coarse-time-limit", type=float, default=600)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--compare", action="store_true", help="also solve the monolithic model")
+    parser.add_argument("--monolithic-time-limit", type=float, default=3600)
+    parser.add_argument("--output", help="write the report as JSON")
+    subparsers = parser.add_subparsers(dest="kind", required=True)
+    pseudo = subparsers.add_parser("pseudo", help="random grid instance, coarsened into square tiles")
+    pseudo.add_argument("--n", type=int, default=12)
+    pseudo.add_argument("--seed", type=int, default=0)
+    pseudo.add_argument("--tile", type=int, default=3)
+    # The defaults scale with the grid: about twice as many seats as students (the pseudo
+    # defaults m=6, c_i=30 for n=6)
+    pseudo.add_argument("--schools", type=int, help="number of schools (default: n)")
+    pseudo.add_argument("--capacity", type=int, help="capacity of each school (default: max students * n)")
+    pseudo.add_argument("--max-students", type=int, default=5, help="maximum number of students per zone")
+    zoning_parser = subparsers.add_parser("zoning", help="San Francisco instance, coarsened into tracts")
+    zoning_parser.add_argument("--centroids", default="670,593,497,723", help="centroid school ids")
+    args = parser.parse_args()
+
+    if args.kind == "pseudo":
+        from pseudo_data_gen import SchoolZoning
+        schools = args.n if args.schools is None else args.schools
+        capacity = args.max_students * args.n if args.capacity is None else args.capacity
+        zoning = SchoolZoning(n=args.n, m=schools, c_i=capacity, s_j=args.max_students, seed=args.seed)
+        groups = tile_groups(args.n, args.tile)
+    else:
+        from zoning_generator import SchoolZoning
+        zoning = SchoolZoning(centroids=[int(c) for c in args.centroids.split(",")])
+        groups = tract_groups(zoning)
+
+    _, report = decompose(
+        zoning, groups, coarse_time_limit=args.coarse_time_limit, rings=args.rings,
+        max_region_units=args.max_region_units, rounds=args.rounds, time_limit=args.time_limit,
+        workers=args.workers,
+    )
+    if args.compare:
+        compare_with_monolithic(zoning, report, args.monolithic_time_limit)
+    print(json.dumps(report, indent=1))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
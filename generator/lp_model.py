@@ -0,0 +1,524 @@
+import numpy as np
+
+# Number of rows serialized per buffered write
+CHUNK_ROWS = 20000
+# Number of terms written on a single line before wrapping
+TERMS_PER_LINE = 32
+
+# Labels below this are formatted through a cached lookup table
+LABEL_TABLE_SIZE = 1 << 20
+
+SENSE_SYMBOLS = {"L": "<=", "G": ">=", "E": "="}
+
+_label_table = np.zeros(0, dtype=object)
+
+
+def format_numbers(values):
+    """
+    Format an array of numbers the way they appear in an LP/MPS file (no trailing zeros).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if np.all(values == np.round(values)) and np.all(np.abs(values) < 1e15):
+        # Integers (the common case) are much faster to format through an int cast
+        return values.astype(np.int64).astype(str).astype(object)
+    return np.char.mod("%.15g", values).astype(object)
+
+
+def label_strings(labels):
+    """
+    Decimal strings of integer labels (dtype object). Small non-negative labels are looked
+    up in a table of preformatted strings, which is much faster than converting each time.
+    """
+    global _label_table
+    labels = np.asarray(labels).astype(np.int64)
+    if len(labels) == 0 or labels.min() < 0 or labels.max() >= LABEL_TABLE_SIZE:
+        return labels.astype(str).astype(object)
+    if labels.max() >= len(_label_table):
+        size = min(LABEL_TABLE_SIZE, max(2 * len(_label_table), int(labels.max()) + 1))
+        _label_table = np.arange(size).astype(str).astype(object)
+    return _label_table[labels]
+
+
+def lp_terms(names, data):
+    """
+    LP text of every term, " + 3 x1_0" / " - x2_0", as an object array.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    signs = np.where(data < 0, " - ", " + ").astype(object)
+    magnitude = np.abs(data)
+    coefs = np.where(magnitude == 1, "", format_numbers(magnitude) + " ").astype(object)
+    return signs + coefs + names
+
+
+def wrap_terms(terms, indptr):
+    """
+    Add line breaks to the terms of a CSR block of rows so long rows span several lines.
+    """
+    starts, ends = indptr[:-1], indptr[1:] - 1
+    position = np.arange(len(terms)) - np.repeat(starts, np.diff(indptr))
+    wrap = (position % TERMS_PER_LINE == TERMS_PER_LINE - 1)
+    wrap[ends] = False
+    terms[wrap] = terms[wrap] + "\n"
+    return terms
+
+
+def concat_ranges(indptr, items):
+    """
+    Concatenation of the ranges indptr[i]:indptr[i + 1] of the items.
+    """
+    items = np.asarray(items, dtype=np.int64)
+    starts, lengths = indptr[items], indptr[items + 1] - indptr[items]
+    # Entry k of a range is its start plus its position after the previous ranges
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(lengths.sum()) + offsets
+
+
+def write_sections(file, sections, section_sizes=None):
+    """
+    Write the text of (section, text) chunks to file, counting the characters per section.
+    """
+    written = 0
+    for section, chunk in sections:
+        n = file.write(chunk)
+        written += n
+        if section_sizes is not None:
+            section_sizes[section] = section_sizes.get(section, 0) + n
+    return written
+
+
+class LPModel(object):
+    """
+    Array-backed MILP model.
+
+    Variables are created in blocks sharing a name prefix (e.g. x{u}_{z}), constraints are
+    stored in blocks of CSR rows (indptr, indices, data) together with their senses and
+    right-hand sides. Names and LP text are only generated in bulk when the model is written.
+    """
+
+    def __init__(self):
+        # List of (prefix, label arrays, vtype, lb, ub, start, size)
+        self.var_blocks = []
+        self.n_vars = 0
+
+        self.obj_indices = np.zeros(0, dtype=np.int64)
+        self.obj_data = np.zeros(0, dtype=np.float64)
+
+        # List of (name, indptr, indices, data, senses, rhs)
+        self.row_blocks = []
+        self.n_rows = 0
+
+        self._names = None
+
+    def add_variables(self, prefix, *labels, vtype="B", lb=0.0, ub=1.0):
+        """
+        Add a block of variables named prefix + "_".join(labels) and return the column index
+        of its first variable. All label arrays must have the same length.
+        """
+        labels = [np.asarray(label, dtype=np.int64) for label in labels]
+        size = len(labels[0])
+        start = self.n_vars
+        self.var_blocks.append((prefix, labels, vtype, lb, ub, start, size))
+        self.n_vars += size
+        self._names = None
+        return start
+
+    def set_objective(self, indices, data):
+        """
+        Set the (minimized) objective as a sparse vector over the columns.
+        """
+        self.obj_indices = np.asarray(indices, dtype=np.int64)
+        self.obj_data = np.broadcast_to(np.asarray(data, dtype=np.float64), self.obj_indices.shape).copy()
+
+    def add_constraints(self, name, indptr, indices, data, senses, rhs):
+        """
+        Add a block of constraint rows given in CSR form. Senses are "L", "G" or "E", and
+        both senses and rhs may be scalars shared by all rows of the block.
+        Empty rows are dropped.
+        """
+        indptr = np.asarray(indptr, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int64)
+        n = len(indptr) - 1
+        data = np.broadcast_to(np.asarray(data, dtype=np.float64), indices.shape).copy()
+        senses = np.broadcast_to(np.asarray(senses, dtype="U1"), (n,)).copy()
+        rhs = np.broadcast_to(np.asarray(rhs, dtype=np.float64), (n,)).copy()
+
+        lengths = np.diff(indptr)
+        if (lengths == 0).any():
+            keep = lengths > 0
+            indptr = np.concatenate(([0], np.cumsum(lengths[keep])))
+            senses, rhs = senses[keep], rhs[keep]
+            n = len(rhs)
+        if n == 0:
+            return
+
+        self.row_blocks.append((name, indptr, indices, data, senses, rhs))
+        self.n_rows += n
+
+    def add_constraints_dense(self, name, indices, data, senses, rhs):
+        """
+        Add a block of rows that all have the same number of terms; indices and data are
+        (rows, terms) arrays.
+        """
+        indices = np.atleast_2d(np.asarray(indices, dtype=np.int64))
+        n, k = indices.shape
+        data = np.broadcast_to(np.asarray(data, dtype=np.float64), (n, k))
+        indptr = np.arange(n + 1, dtype=np.int64) * k
+        self.add_constraints(name, indptr, indices.ravel(), data.ravel(), senses, rhs)
+
+    @property
+    def nnz(self):
+        return sum(len(block[2]) for block in self.row_blocks)
+
+    def var_names(self):
+        """
+        Array (dtype object) with the name of every column, generated block by block.
+        """
+        if self._names is None:
+            names = np.empty(self.n_vars, dtype=object)
+            for prefix, labels, _, _, _, start, size in self.var_blocks:
+                block = np.full(size, prefix, dtype=object)
+                for k, label in enumerate(labels):
+                    if k > 0:
+                        block = block + "_"
+                    block = block + label_strings(label)
+                names[start:start + size] = block
+            self._names = names
+        return self._names
+
+    def var_types(self):
+        vtypes = np.empty(self.n_vars, dtype="U1")
+        for _, _, vtype, _, _, start, size in self.var_blocks:
+            vtypes[start:start + size] = vtype
+        return vtypes
+
+    def to_csr(self):
+        """
+        Stack all constraint blocks and return (indptr, indices, data, senses, rhs).
+        """
+        if not self.row_blocks:
+            return (np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                    np.zeros(0), np.zeros(0, dtype="U1"), np.zeros(0))
+        offsets = np.cumsum([0] + [len(block[2]) for block in self.row_blocks[:-1]])
+        indptr = np.concatenate(
+            [[0]] + [block[1][1:] + offset for block, offset in zip(self.row_blocks, offsets)]
+        )
+        indices = np.concatenate([block[2] for block in self.row_blocks])
+        data = np.concatenate([block[3] for block in self.row_blocks])
+        senses = np.concatenate([block[4] for block in self.row_blocks])
+        rhs = np.concatenate([block[5] for block in self.row_blocks])
+        return indptr, indices, data, senses, rhs
+
+    def row_index(self):
+        """
+        Stacked rows for repeated row_slack and restrict calls on an unchanged model: the
+        CSR arrays of to_csr, the row of every entry and a column-major order of the entries.
+        """
+        indptr, indices, data, senses, rhs = self.to_csr()
+        column_entries = np.argsort(indices, kind="stable")
+        column_indptr = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=self.n_vars))))
+        return {
+            "indptr": indptr, "indices": indices, "data": data, "senses": senses, "rhs": rhs,
+            "rows_of": np.repeat(np.arange(self.n_rows), np.diff(indptr)),
+            "column_indptr": column_indptr, "column_entries": column_entries,
+        }
+
+    def row_activity(self, values, index=None):
+        """
+        Left-hand side of every row for the column values.
+        """
+        index = self.row_index() if index is None else index
+        return np.bincount(index["rows_of"], weights=index["data"] * values[index["indices"]], minlength=self.n_rows)
+
+    def row_slack(self, values, index=None):
+        """
+        Slack of every row for the column values, negative when the row is violated.
+        Equality rows have minus their absolute violation as slack.
+        """
+        index = self.row_index() if index is None else index
+        senses, rhs = index["senses"], index["rhs"]
+        activity = self.row_activity(values, index)
+        return np.select([senses == "L", senses == "G"], [rhs - activity, activity - rhs], -np.abs(activity - rhs))
+
+    def objective_value(self, values):
+        return float(np.dot(self.obj_data, values[self.obj_indices]))
+
+    def rows_of_columns(self, columns, index=None):
+        """
+        Sorted rows with a nonzero in one of the columns.
+        """
+        index = self.row_index() if index is None else index
+        entries = index["column_entries"][concat_ranges(index["column_indptr"], columns)]
+        return np.unique(index["rows_of"][entries])
+
+    def restrict(self, free, values, tighten=None, index=None):
+        """
+        Model over the free columns (boolean mask) with every other column fixed to its
+        value: fixed terms move to the right-hand sides and rows without free columns are
+        dropped. tighten optionally lowers the slack of the inequality rows (one value per
+        row of this model). Returns (model, columns, rows), the columns and rows of this
+        model kept in the restricted one. With an index from row_index(), only the rows of
+        the free columns are read.
+        """
+        index = self.row_index() if index is None else index
+        columns = np.flatnonzero(free)
+        rows = self.rows_of_columns(columns, index)
+        entries = concat_ranges(index["indptr"], rows)
+        indices, data = index["indices"][entries], index["data"][entries]
+        local_row = np.repeat(np.arange(len(rows)), np.diff(index["indptr"])[rows])
+        is_free = free[indices]
+        fixed = np.bincount(local_row[~is_free], weights=data[~is_free] * values[indices[~is_free]],
+                            minlength=len(rows))
+
+        senses = index["senses"][rows]
+        rhs = index["rhs"][rows] - fixed
+        if tighten is not None:
+            rhs = rhs - np.select([senses == "L", senses == "G"], [tighten[rows], -tighten[rows]], 0.0)
+
+        model = LPModel()
+        for prefix, labels, vtype, lb, ub, start, size in self.var_blocks:
+            keep = free[start:start + size]
+            if keep.any():
+                model.add_variables(prefix, *[label[keep] for label in labels], vtype=vtype, lb=lb, ub=ub)
+        keep = free[self.obj_indices]
+        model.set_objective(np.searchsorted(columns, self.obj_indices[keep]), self.obj_data[keep])
+
+        counts = np.bincount(local_row[is_free], minlength=len(rows))
+        model.add_constraints("restricted", np.concatenate(([0], np.cumsum(counts))),
+                              np.searchsorted(columns, indices[is_free]), data[is_free], senses, rhs)
+        return model, columns, rows
+
+    def _terms(self, indices, data):
+        return lp_terms(self.var_names()[indices], data)
+
+    def _wrapped_terms(self, indptr, indices, data):
+        return wrap_terms(self._terms(indices, data), indptr)
+
+    def _rows_text(self, first_row, indptr, indices, data, senses, rhs):
+        """
+        LP text of a CSR block of rows, numbered from first_row, as a single string.
+        """
+        terms = self._wrapped_terms(indptr, indices, data)
+        n = len(rhs)
+        starts, ends = indptr[:-1], indptr[1:] - 1
+
+        row_names = " c" + label_strings(np.arange(first_row, first_row + n)) + ":"
+        terms[starts] = row_names + terms[starts]
+        symbols = np.vectorize(SENSE_SYMBOLS.get, otypes=[object])(senses)
+        terms[ends] = terms[ends] + " " + symbols + " " + format_numbers(rhs) + "\n"
+        return "".join(terms.tolist())
+
+    def iter_lp_sections(self, chunk_rows=CHUNK_ROWS):
+        """
+        Yield (section, text) chunks of the CPLEX-LP text of the model, in large chunks of
+        constraint rows. Sections are "objective", the name of each constraint block and
+        "variables".
+        """
+        yield "objective", "Minimize\n obj:"
+        if len(self.obj_indices):
+            indptr = np.array([0, len(self.obj_indices)])
+            yield "objective", "".join(self._wrapped_terms(indptr, self.obj_indices, self.obj_data).tolist())
+        yield "objective", "\nSubject To\n"
+
+        row = 1
+        for name, indptr, indices, data, senses, rhs in self.row_blocks:
+            n = len(rhs)
+            for r0 in range(0, n, chunk_rows):
+                r1 = min(r0 + chunk_rows, n)
+                lo, hi = indptr[r0], indptr[r1]
+                yield name, self._rows_text(row, indptr[r0:r1 + 1] - lo, indices[lo:hi], data[lo:hi],
+                                            senses[r0:r1], rhs[r0:r1])
+                row += r1 - r0
+
+        names = self.var_names()
+        bounds, binaries, generals = [], [], []
+        for _, _, vtype, lb, ub, start, size in self.var_blocks:
+            block = names[start:start + size]
+            if vtype == "B":
+                binaries.append(block)
+                continue
+            if vtype == "I":
+                generals.append(block)
+            if lb != 0 or ub != np.inf:
+                bounds.append(f" {lb:.15g} <= " + block + f" <= {ub:.15g}\n")
+
+        if bounds:
+            yield "variables", "Bounds\n"
+            for block in bounds:
+                yield "variables", "".join(block.tolist())
+        for section, blocks in (("Binaries", binaries), ("General", generals)):
+            if blocks:
+                yield "variables", section + "\n"
+                for block in blocks:
+                    for i in range(0, len(block), chunk_rows):
+                        yield "variables", " " + "\n ".join(block[i:i + chunk_rows].tolist()) + "\n"
+        yield "variables", "End\n"
+
+    def iter_lp_chunks(self, chunk_rows=CHUNK_ROWS):
+        """
+        Yield the CPLEX-LP text of the model in large chunks of constraint rows.
+        """
+        for _, chunk in self.iter_lp_sections(chunk_rows):
+            yield chunk
+
+    def write_lp(self, file, chunk_rows=CHUNK_ROWS, section_sizes=None):
+        """
+        Write the model in CPLEX-LP format to an open text file. Returns the number of
+        characters written. If section_sizes is a dict, the characters written per section
+        (see iter_lp_sections) are added to it.
+        """
+        return write_sections(file, self.iter_lp_sections(chunk_rows), section_sizes)
+
+    def to_scip(self, name="model"):
+        """
+        Build a pyscipopt.Model holding this model, without going through a file.
+        """
+        from pyscipopt import Model
+        from pyscipopt.scip import Expr, Term
+
+        scip = Model(name)
+        names, vtypes = self.var_names(), self.var_types()
+        bounds = np.empty((self.n_vars, 2))
+        for _, _, _, lb, ub, start, size in self.var_blocks:
+            bounds[start:start + size] = lb, ub
+        # pyscipopt uses None for infinite bounds
+        bounds = [[None if np.isinf(b) else b for b in bound] for bound in bounds.tolist()]
+
+        obj = np.zeros(self.n_vars)
+        np.add.at(obj, self.obj_indices, self.obj_data)
+        variables = [
+            scip.addVar(name, vtype=vtype, lb=lb, ub=ub, obj=c)
+            for name, vtype, (lb, ub), c in zip(names.tolist(), vtypes.tolist(), bounds, obj.tolist())
+        ]
+        terms = [Term(var) for var in variables]
+
+        row = 1
+        for _, indptr, indices, data, senses, rhs in self.row_blocks:
+            conss, cons_names = [], []
+            indices, data = indices.tolist(), data.tolist()
+            for r, (sense, b) in enumerate(zip(senses.tolist(), rhs.tolist())):
+                lo, hi = indptr[r], indptr[r + 1]
+                expr = Expr(dict(zip([terms[j] for j in indices[lo:hi]], data[lo:hi])))
+                if sense == "L":
+                    conss.append(expr <= b)
+                elif sense == "G":
+                    conss.append(expr >= b)
+                else:
+                    conss.append(expr == b)
+                cons_names.append(f"c{row}")
+                row += 1
+            scip.addConss(conss, name=cons_names)
+        return scip
+
+    def iter_mps_sections(self, name="model", chunk_rows=CHUNK_ROWS):
+        """
+        Yield (section, text) chunks of the free-MPS text of the model. Sections are
+        "rows", "columns", "rhs" and "bounds".
+        """
+        indptr, indices, data, senses, rhs = self.to_csr()
+        row_names = "c" + label_strings(np.arange(1, len(rhs) + 1))
+
+        yield "rows", f"NAME {name}\nROWS\n N obj\n"
+        for r0 in range(0, len(rhs), chunk_rows):
+            block = " " + senses[r0:r0 + chunk_rows].astype(object) + " " + row_names[r0:r0 + chunk_rows]
+            yield "rows", "\n".join(block.tolist()) + "\n"
+
+        # Column-major entries, the objective is stored as row -1
+        rows = np.concatenate((np.full(len(self.obj_indices), -1), np.repeat(np.arange(len(rhs)), np.diff(indptr))))
+        cols = np.concatenate((self.obj_indices, indices))
+        values = np.concatenate((self.obj_data, data))
+        # Every column must appear at least once
+        empty = np.setdiff1d(np.arange(self.n_vars), cols)
+        rows = np.concatenate((rows, np.full(len(empty), -1)))
+        cols = np.concatenate((cols, empty))
+        values = np.concatenate((values, np.zeros(len(empty))))
+        order = np.argsort(cols, kind="stable")
+        rows, cols, values = rows[order], cols[order], values[order]
+        del order
+        entry_rows = np.concatenate((np.array(["obj"], dtype=object), row_names))[rows + 1]
+
+        names = self.var_names()
+        yield "columns", "COLUMNS\n"
+        for k, (_, _, vtype, _, _, start, size) in enumerate(self.var_blocks):
+            integer = vtype in ("B", "I")
+            if integer:
+                yield "columns", f" M{k} 'MARKER' 'INTORG'\n"
+            lo, hi = np.searchsorted(cols, [start, start + size])
+            for i in range(lo, hi, chunk_rows):
+                j = min(i + chunk_rows, hi)
+                lines = " " + names[cols[i:j]] + " " + entry_rows[i:j] + " " + format_numbers(values[i:j]) + "\n"
+                yield "columns", "".join(lines.tolist())
+            if integer:
+                yield "columns", f" M{k} 'MARKER' 'INTEND'\n"
+
+        yield "rhs", "RHS\n"
+        nonzero = np.flatnonzero(rhs)
+        for i in range(0, len(nonzero), chunk_rows):
+            rows = nonzero[i:i + chunk_rows]
+            lines = " RHS " + row_names[rows] + " " + format_numbers(rhs[rows]) + "\n"
+            yield "rhs", "".join(lines.tolist())
+
+        yield "bounds", "BOUNDS\n"
+        for _, _, vtype, lb, ub, start, size in self.var_blocks:
+            block = names[start:start + size]
+            if vtype == "B":
+                lines = [" BV BND " + block + "\n"]
+            elif lb == -np.inf and ub == np.inf:
+                lines = [" FR BND " + block + "\n"]
+            else:
+                lines = []
+                if lb != 0:
+                    lines.append(" MI BND " + block + "\n" if lb == -np.inf else " LO BND " + block + f" {lb:.15g}\n")
+                lines.append(" PL BND " + block + "\n" if ub == np.inf else " UP BND " + block + f" {ub:.15g}\n")
+            for line in lines:
+                yield "bounds", "".join(line.tolist())
+        yield "bounds", "ENDATA\n"
+
+    def iter_mps_chunks(self, name="model", chunk_rows=CHUNK_ROWS):
+        """
+        Yield the free-MPS text of the model in large chunks.
+        """
+        for _, chunk in self.iter_mps_sections(name, chunk_rows):
+            yield chunk
+
+    def write_mps(self, file, name="model", chunk_rows=CHUNK_ROWS, section_sizes=None):
+        """
+        Write the model in free-MPS format to an open text file. Returns the number of
+        characters written. If section_sizes is a dict, the characters written per section
+        (see iter_mps_sections) are added to it.
+        """
+        return write_sections(file, self.iter_mps_sections(name, chunk_rows), section_sizes)
+
+    def save_npz(self, path):
+        """
+        Save the model as a compressed NumPy archive: the stacked CSR matrix, senses, rhs,
+        objective and the variable blocks (prefix, labels, type and bounds) instead of names.
+        """
+        indptr, indices, data, senses, rhs = self.to_csr()
+        arrays = {
+            "indptr": indptr, "indices": indices, "data": data, "senses": senses, "rhs": rhs,
+            "obj_indices": self.obj_indices, "obj_data": self.obj_data,
+            "var_prefixes": np.array([block[0] for block in self.var_blocks]),
+            "var_types": np.array([block[2] for block in self.var_blocks]),
+            "var_bounds": np.array([block[3:5] for block in self.var_blocks], dtype=np.float64).reshape(-1, 2),
+            "var_n_labels": np.array([len(block[1]) for block in self.var_blocks], dtype=np.int64),
+        }
+        for k, block in enumerate(self.var_blocks):
+            for j, label in enumerate(block[1]):
+                arrays[f"var{k}_label{j}"] = label
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load_npz(cls, path):
+        """
+        Load a model saved with save_npz. The constraints come back as a single block.
+        """
+        model = cls()
+        with np.load(path) as archive:
+            for k, prefix in enumerate(archive["var_prefixes"]):
+                labels = [archive[f"var{k}_label{j}"] for j in range(archive["var_n_labels"][k])]
+                lb, ub = archive["var_bounds"][k]
+                model.add_variables(str(prefix), *labels, vtype=str(archive["var_types"][k]), lb=lb, ub=ub)
+            model.set_objective(archive["obj_indices"], archive["obj_data"])
+            model.add_constraints("rows", archive["indptr"], archive["indices"], archive["data"],
+                                  archive["senses"], archive["rhs"])
+        return model
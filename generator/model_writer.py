@@ -0,0 +1,61 @@
+import gzip
+import os
+
+# Writers keyed by format name, each called as writer(model, path_or_file, name, section_sizes)
+WRITERS = {
+    "lp": lambda model, file, name, sizes: model.write_lp(file, section_sizes=sizes),
+    "mps": lambda model, file, name, sizes: model.write_mps(file, name, section_sizes=sizes),
+    "npz": lambda model, path, name, sizes: model.save_npz(path),
+}
+
+# Formats written to a binary file by the writer itself
+BINARY_FORMATS = {"npz"}
+
+# gzip level used for compressed text output
+COMPRESS_LEVEL = 6
+
+
+def infer_format(path):
+    """
+    Return (format, compressed) from a file name such as school_zoning_0.mps.gz.
+    """
+    base, ext = os.path.splitext(path)
+    compressed = ext == ".gz"
+    if compressed:
+        ext = os.path.splitext(base)[1]
+    fmt = ext.lstrip(".").lower()
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown model format '{fmt}' for {path}")
+    return fmt, compressed
+
+
+def sidecar_path(path):
+    """
+    Path of the .npz sidecar written next to a text model file.
+    """
+    return os.path.join(os.path.dirname(path), os.path.basename(path).split(".")[0] + ".npz")
+
+
+def write_model(model, path, fmt=None, compressed=None, sidecar=False, section_sizes=None, name=None):
+    """
+    Write an LPModel to path. The format (lp, mps or npz) and gzip compression are
+    inferred from the file name unless given explicitly. With sidecar=True, text formats
+    are accompanied by an .npz copy of the model for tools that do not want to parse text.
+    For text formats, the uncompressed characters written per section are added to the
+    section_sizes dict if one is given. The model name (MPS NAME) defaults to the file name
+    without its extensions; pass it when writing to a temporary path.
+    """
+    inferred_fmt, inferred_compressed = infer_format(path) if fmt is None else (fmt, path.endswith(".gz"))
+    fmt = inferred_fmt
+    compressed = inferred_compressed if compressed is None else compressed
+    name = os.path.basename(path).split(".")[0] if name is None else name
+
+    if fmt in BINARY_FORMATS:
+        return WRITERS[fmt](model, path, name, section_sizes)
+    if sidecar:
+        model.save_npz(sidecar_path(path))
+    if compressed:
+        with gzip.open(path, "wt", compresslevel=COMPRESS_LEVEL) as f:
+            return WRITERS[fmt](model, f, name, section_sizes)
+    with open(path, "w") as f:
+        return WRITERS[fmt](model, f, name, section_sizes)
@@ -1,33 +1,137 @@
+import hashlib
+import json
+import os
+
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import shapely
 import matplotlib.pyplot as plt
 
+from data_store import DATA_DIR, _source_hashes
+
 
 CENSUS_SHAPEFILE_PATH = "data/shape_file/geo_export_d4e9e90c-ff77-4dc9-a766-6a1a7f7d9f9c.shp"
 CENSUS_TRASLATOR_PATH = "data/block_blockgroup_tract.csv"
 
-def get_census_df():
-    census = gpd.read_file(CENSUS_SHAPEFILE_PATH)
+# Bump when the layout of the spatial cache changes
+SPATIAL_CACHE_VERSION = 1
+# Inputs of the spatial cache, relative to the data directory
+SPATIAL_SOURCES = {
+    "shapes": os.path.relpath(CENSUS_SHAPEFILE_PATH, DATA_DIR),
+    "shape_attributes": os.path.splitext(os.path.relpath(CENSUS_SHAPEFILE_PATH, DATA_DIR))[0] + ".dbf",
+    "tracts": os.path.relpath(CENSUS_TRASLATOR_PATH, DATA_DIR),
+}
+
+# Layers already loaded in this process, keyed by data directory
+_LAYERS = {}
+
+def get_census_df(shapefile_path=CENSUS_SHAPEFILE_PATH, translator_path=CENSUS_TRASLATOR_PATH):
+    census = gpd.read_file(shapefile_path)
 
     census['geoid10'] = census['geoid10'].fillna(value=0).astype('int64', copy=False)
-    df = pd.read_csv(CENSUS_TRASLATOR_PATH)
+    df = pd.read_csv(translator_path)
     df['Block'] = df['Block'].fillna(value=0).astype('int64', copy=False)
     census = census.merge(df, how='left', left_on='geoid10', right_on='Block')
     return census
 
-def generate_partial_map():
-    census_original = get_census_df()
 
-    census = census_original.copy()
-    census = census.dissolve(by="Tract", as_index=False)
+class SpatialLayer(object):
+    """
+    Census tracts dissolved from the block shapefile, loaded from the spatial cache:
+        tracts: tract ids
+        geometries: tract polygons (shapely), indexed by an STRtree
+        centroids: (tracts, 2) array of tract centroid (x, y), i.e. (longitude, latitude)
+        block_ids, block_tracts: census block ids and the tract of each
+    Region queries return sorted tract ids, blocks(tracts) the census blocks they contain.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.tracts = data["tracts"]
+            self.centroids = data["centroids"]
+            self.block_ids = data["block_ids"]
+            self.block_tracts = data["block_tracts"]
+            wkb, offsets = data["wkb"], data["wkb_offsets"]
+        self.geometries = shapely.from_wkb([wkb[lo:hi].tobytes() for lo, hi in zip(offsets[:-1], offsets[1:])])
+        self.tree = shapely.STRtree(self.geometries)
+
+    def tracts_above_latitude(self, latitude):
+        return np.sort(self.tracts[self.centroids[:, 1] > latitude])
+
+    def tracts_in_polygon(self, polygon, predicate="centroid"):
+        """
+        Tracts whose centroid lies in the polygon (predicate="centroid"), or whose geometry
+        satisfies a shapely predicate with it, e.g. "intersects" or "within".
+        """
+        if predicate == "centroid":
+            # A tract with its centroid in the polygon intersects its bounding box
+            candidates = self.tree.query(polygon)
+            inside = shapely.contains_xy(polygon, self.centroids[candidates, 0], self.centroids[candidates, 1])
+            return np.sort(self.tracts[candidates[inside]])
+        return np.sort(self.tracts[self.tree.query(polygon, predicate=predicate)])
+
+    def tracts_in_bbox(self, min_x, min_y, max_x, max_y, predicate="centroid"):
+        return self.tracts_in_polygon(shapely.box(min_x, min_y, max_x, max_y), predicate)
+
+    def blocks(self, tracts):
+        """
+        Census block ids of the given tracts, as consumed by SchoolZoning(blocks=...).
+        """
+        return self.block_ids[np.isin(self.block_tracts, tracts)]
+
+
+def _build_layer(data_dir, path):
+    """
+    Dissolve the blocks into tracts and write the spatial cache file.
+    """
+    census = get_census_df(
+        os.path.join(data_dir, SPATIAL_SOURCES["shapes"]), os.path.join(data_dir, SPATIAL_SOURCES["tracts"])
+    )
+    census = census[census["Tract"].notna()]
+    tracts = census.dissolve(by="Tract", as_index=False)
+    centroids = tracts.centroid
+
+    wkb = shapely.to_wkb(tracts.geometry.values)
+    offsets = np.concatenate(([0], np.cumsum([len(geometry) for geometry in wkb])))
+    tmp_path = path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        tracts=tracts["Tract"].to_numpy(dtype=np.int64),
+        centroids=np.stack([centroids.x.to_numpy(), centroids.y.to_numpy()], axis=1),
+        wkb=np.frombuffer(b"".join(wkb), dtype=np.uint8),
+        wkb_offsets=offsets.astype(np.int64),
+        block_ids=census["geoid10"].to_numpy(dtype=np.int64),
+        block_tracts=census["Tract"].to_numpy(dtype=np.int64),
+    )
+    os.replace(tmp_path, path)
+
+
+def load_spatial_layer(data_dir=DATA_DIR, cache_dir=None):
+    """
+    Return the SpatialLayer of data_dir. The shapefile is dissolved once into a cache file
+    (data_dir/cache by default) keyed by the hashes of its inputs, and the loaded layer is
+    shared by every caller in the process.
+    """
+    key = os.path.abspath(data_dir)
+    if key in _LAYERS:
+        return _LAYERS[key]
+
+    cache_dir = os.path.join(data_dir, "cache") if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    hashes = _source_hashes(data_dir, cache_dir, SPATIAL_SOURCES)
+    digest = hashlib.sha1(json.dumps([SPATIAL_CACHE_VERSION, hashes], sort_keys=True).encode()).hexdigest()
+    path = os.path.join(cache_dir, f"spatial_v{SPATIAL_CACHE_VERSION}_{digest[:16]}.npz")
+    if not os.path.exists(path):
+        print("Building spatial cache", path)
+        _build_layer(data_dir, path)
+
+    _LAYERS[key] = SpatialLayer(path)
+    return _LAYERS[key]
 
-    # Filter tracts with latitude greater than a specific value
-    latitude_threshold = 37.76  # Example latitude threshold
 
-    census = census[census.centroid.y > latitude_threshold]
-    # for i, y in enumerate(census.centroid.y):
-    #     if y < latitude_threshold:
-    #         census.drop(i, inplace=True)
-    remaining_tracts = census.index.tolist()
-    
-    return remaining_tracts
\ No newline at end of file
+def generate_partial_map(latitude_threshold=37.76):
+    """
+    Tracts whose centroid is north of the latitude threshold.
+    """
+    return load_spatial_layer().tracts_above_latitude(latitude_threshold).tolist()
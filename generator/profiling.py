@@ -0,0 +1,130 @@
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of the process in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def current_rss_mb():
+    """
+    Current resident memory of the process in MB, None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class GenerationProfile(object):
+    """
+    Phase timers, counters and memory of the generation of one instance.
+
+        profile = GenerationProfile("school_zoning_0")
+        with profile.phase("compactness"):
+            ...
+        profile.count("compactness_rows", n)
+        profile.summary()  # JSON-serializable dict
+
+    Nested phases are reported as "outer/inner", with the resident memory at their start
+    and end (the peak RSS of the process is only reported for the whole run, it never
+    decreases and includes the parent of a forked worker). With trace_memory=True the peak
+    of the Python allocations is traced per phase (slower). With cprofile=True the phases
+    run under cProfile, see dump_stats and print_stats.
+    """
+
+    def __init__(self, name=None, cprofile=False, trace_memory=False):
+        self.name = name
+        self.phases = {}
+        self.counters = {}
+        self.memory = {}
+        self.stack = []
+        self.trace_memory = trace_memory
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.created = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.stack.append(name)
+        key = "/".join(self.stack)
+        # Register the phase on entry so that outer phases are listed before inner ones
+        self.phases.setdefault(key, 0.0)
+        outermost = len(self.stack) == 1
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.profiler is not None and outermost:
+            self.profiler.enable()
+        rss_start = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.profiler is not None and outermost:
+                self.profiler.disable()
+            self.phases[key] += elapsed
+            memory = {"rss_start_mb": rss_start, "rss_end_mb": current_rss_mb()}
+            if self.trace_memory:
+                memory["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+            self.memory[key] = memory
+            self.stack.pop()
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def add_counts(self, prefix, counts):
+        for name, value in counts.items():
+            self.count(f"{prefix}_{name}", value)
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "total_time": time.perf_counter() - self.created,
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+            "memory": dict(self.memory),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def write(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=1)
+
+    def dump_stats(self, path):
+        """
+        Write the cProfile statistics (readable with pstats or snakeviz).
+        """
+        self.profiler.dump_stats(path)
+
+    def print_stats(self, n=25, sort="cumulative"):
+        pstats.Stats(self.profiler).sort_stats(sort).print_stats(n)
+
+    def report(self):
+        """
+        Print the phase timings and counters.
+        """
+        for key, seconds in self.phases.items():
+            depth = key.count("/")
+            memory = self.memory[key]
+            rss = ""
+            if memory["rss_end_mb"] is not None:
+                rss = f"  {memory['rss_end_mb']: >8.1f} MB ({memory['rss_end_mb'] - memory['rss_start_mb']:+.1f})"
+            print(f"{'  ' * depth}{key.split('/')[-1]: <{32 - 2 * depth}} {seconds: >9.3f}s{rss}")
+        for name, value in self.counters.items():
+            print(f"{name: <32} {value: >10}")
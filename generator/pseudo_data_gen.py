@@ -1,80 +1,78 @@
 import pandas as pd
 import numpy as np
-import random
-from itertools import product
-from utils import filter_closer_than_cent_pseudo
+from contiguity import ContiguityIndex
+from zoning_model import ZoningModel
+
+def grid_distances(centroids, n):
+    """
+    Manhattan distances from each centroid zone (rows) to every zone 1..n**2 of the n x n grid.
+    """
+    zone_ids = np.arange(1, n**2 + 1)
+    rows, cols = (zone_ids - 1) // n, (zone_ids - 1) % n
+    centroids = np.asarray(centroids)
+    cent_rows, cent_cols = (centroids - 1) // n, (centroids - 1) % n
+    return np.abs(cent_rows[:, None] - rows) + np.abs(cent_cols[:, None] - cols)
+
+def generate_school_data(n, m, c_i, s_j, seed=None):
+    """
+    Random n x n grid instance with m schools of capacity c_i and up to s_j students per zone.
+    Zones are numbered 1..n**2 row by row.
+
+    Returns the zone DataFrame, the (directed) neighboring pairs as an (E, 2) array, the
+    neighbor lists of every zone, the Manhattan distances from each selected zone to every
+    zone (DataFrame indexed by the selected zones) and the selected zones.
+    """
+    rng = np.random.default_rng(seed)
 
-def generate_school_data(n, m, c_i, s_j):
     # Generate zone IDs
     zone_ids = np.arange(1, n**2 + 1)
+    grid = zone_ids.reshape(n, n)
     
     # Randomly select m zones to build schools
-    selected_zones = random.sample(list(zone_ids), m)
+    selected_zones = rng.choice(zone_ids, m, replace=False)
+    has_school = np.isin(zone_ids, selected_zones)
     
     # Create data for the pandas DataFrame
     data = {
         'census_block': zone_ids,
-        'number_of_schools': [1 if zone_id in selected_zones else 0 for zone_id in zone_ids],
-        'total_seat_capacity': [c_i if zone_id in selected_zones else 0 for zone_id in zone_ids],
-        'number_of_students': [random.randint(0, s_j) for _ in range(n**2)]
+        'number_of_schools': has_school.astype(np.int64),
+        'total_seat_capacity': np.where(has_school, c_i, 0),
+        'number_of_students': rng.integers(0, s_j, size=n**2, endpoint=True)
     }
     
     # Create the DataFrame
     df = pd.DataFrame(data)
     
-    # Generate neighboring pairs
-    neighboring_pairs = []
-    for i in range(1, n**2+1):
-        for j in range(1, n**2+1):
-            zone_id = (i-1) * n + j
-            neighbors = []
-            if i > 1 and zone_id - n > 0:
-                neighbors.append(zone_id - n)
-            if i < n and zone_id + n <= n**2:
-                neighbors.append(zone_id + n)
-            if j > 1 and zone_id - 1 > 0:
-                neighbors.append(zone_id - 1)
-            if j < n and zone_id + 1 <= n**2:
-                neighbors.append(zone_id + 1)
-            neighboring_pairs.extend([(zone_id, neighbor) for neighbor in neighbors])
+    # Generate neighboring pairs (4-neighborhood) by shifting the grid
+    left, right = grid[:, :-1].ravel(), grid[:, 1:].ravel()
+    up, down = grid[:-1, :].ravel(), grid[1:, :].ravel()
+    u = np.concatenate([left, right, up, down])
+    v = np.concatenate([right, left, down, up])
+    order = np.lexsort((v, u))
+    neighboring_pairs = np.stack([u[order], v[order]], axis=1)
     
     # Create a dictionary with zone_id as keys and a list of neighbor zones as values
-    neighbors_dict = {}
-    for zone_id in zone_ids:
-        neighbors_dict[zone_id] = set([neighbor[1] for neighbor in neighboring_pairs if neighbor[0] == zone_id])
-    
-    # Create a DataFrame for the distance between every zone pair
-    distances = []
-    for pair in product(zone_ids, repeat=2):
-        if pair[0] != pair[1]:
-            dist = abs((pair[0]-1) // n - (pair[1]-1) // n) + abs((pair[0]-1) % n - (pair[1]-1) % n)
-            distances.append(pair + (dist,))
+    splits = np.cumsum(np.bincount(neighboring_pairs[:, 0], minlength=n**2 + 1)[1:])[:-1]
+    neighbors_dict = dict(zip(zone_ids.tolist(), [part.tolist() for part in np.split(neighboring_pairs[:, 1], splits)]))
     
-    distance_df = pd.DataFrame(distances, columns=['zone_id_1', 'zone_id_2', 'distance'])
-    
-    # Create a square DataFrame initialized with NaNs
-    distance_matrix = pd.DataFrame(np.nan, index=zone_ids, columns=zone_ids)
-
-    # Fill the matrix with distances
-    for _, row in distance_df.iterrows():
-        distance_matrix.at[row['zone_id_1'], row['zone_id_2']] = row['distance']
-        distance_matrix.at[row['zone_id_2'], row['zone_id_1']] = row['distance']
-
-    # Set diagonal to 0 (distance from a zone to itself)
-    np.fill_diagonal(distance_matrix.values, 0)
-
+    # Manhattan distance from every selected zone to every zone
+    distance_matrix = pd.DataFrame(grid_distances(selected_zones, n), index=selected_zones, columns=zone_ids)
     
-    return df, neighboring_pairs, neighbors_dict, distance_matrix, selected_zones
+    return df, neighboring_pairs, neighbors_dict, distance_matrix, selected_zones.tolist()
 
-class SchoolZoning(object):
-    def __init__(self, file):
-        
-        n = 6  # Size of the grid map (n x n)
-        m = 6  # Number of zones to build schools
-        c_i = 30  # Capacity of each school
-        s_j = 5  # Maximum number of students in each zone
+class SchoolZoning(ZoningModel):
+    def __init__(self, file=None, n=6, m=6, c_i=30, s_j=5, seed=None, profile=None, compact=False):
+        # n: Size of the grid map (n x n)
+        # m: Number of zones to build schools
+        # c_i: Capacity of each school
+        # s_j: Maximum number of students in each zone
+        # seed: Seed of the random generator
+        # profile: GenerationProfile recording the generation phases (optional)
+        # compact: one b variable per undirected neighboring edge (see ZoningModel)
+        self.init_profile(profile)
 
-        school_df, neighboring_pairs, neighbors_dict, distance_matrix, centroids = generate_school_data(n, m, c_i, s_j)
+        with self.profile.phase("generate_data"):
+            school_df, neighboring_pairs, neighbors_dict, distance_matrix, centroids = generate_school_data(n, m, c_i, s_j, seed)
 
         # Load area data
         self.area_data = school_df
@@ -104,87 +102,34 @@ class SchoolZoning(object):
         self.centroids = centroids
         
         # Neighbor data
-        neighbor_pairs, neighbor_dict = set(neighboring_pairs), neighbors_dict
-        self.neighbor_pairs, self.neighbor_dict = neighbor_pairs, neighbor_dict
+        self.neighbor_pairs, self.neighbor_dict = neighboring_pairs, neighbors_dict
         
         # Number of schools
         self.SCH = self.area_data['number_of_schools'].sum()
-        self.c_count = 1
         
         self.d = distance_matrix
         
-    def add_objective(self):
-        
-        self.file.write("Minimize\n obj: ")
-        self.file.write(" + ".join(f"b{u}_{v}" for u, v in self.neighbor_pairs))
-        self.file.write("\nSubject To\n")
-        
-    def add_feasibility_constraints(self):
-        # Each area is assigned to 1 zone
-        for u in self.units:
-            self.file.write(f" c{self.c_count}: " + " + ".join(f"x{u}_{z}" for z in range(self.Z)) + " = 1\n")
-            self.c_count += 1
-        
-        # Compactness constraint
-        print("Adding Compactness constraint")
-        for u, v in self.neighbor_pairs:
-            for z in range(self.Z):
-                self.file.write(f" c{self.c_count}: x{u}_{z} - x{v}_{z} - b{u}_{v} <= 0\n")
-                self.c_count += 1
-                self.file.write(f" c{self.c_count}: x{u}_{z} - x{v}_{z} + b{u}_{v} >= 0\n")
-                self.c_count += 1
-        print("Compactness constraint added")
-                
-        # Contiguity cosntraint
-        print("Adding Contiguity constraint")
-        for u in self.units:
-            for z in range(self.Z):
-                cent = self.centroids[z]
-                
-                v_list = self.neighbor_dict[u] # List in census block id 
-                v_list = filter_closer_than_cent_pseudo(v_list, u, cent, self.d) 
-                
-                if v_list != []:
-                    self.file.write(f" c{self.c_count}: x{u}_{z} - " + " - ".join(f"x{v}_{z}" for v in v_list) + " <= 0 \n")
-                self.c_count += 1
-        print("Contiguity constraint added")
-        
-    
-    def add_balancing_constraints(self):
-        # Add seat balancing constraint
-        for z in range(self.Z):
-            self.file.write(
-                f" c{self.c_count}: " + " + ".join(
-                    f"{self.seatsInArea[u] - self.studentsInArea[u]} x{u}_{z}" for u in self.units if (self.seatsInArea[u] - self.studentsInArea[u]) != 0
-                ) + " >= 0\n"
+        # Array view of the instance for the model builder
+        self.labels = self.area_data['census_block'].to_numpy()
+        self.students = self.area_data['number_of_students'].to_numpy()
+        self.seats = self.area_data['total_seat_capacity'].to_numpy()
+        self.schools = self.area_data['number_of_schools'].to_numpy()
+        # Zone ids are 1..n**2, so zone u is at position u - 1
+        self.pair_u = self.neighbor_pairs[:, 0] - 1
+        self.pair_v = self.neighbor_pairs[:, 1] - 1
+        with self.profile.phase("contiguity_index"):
+            # Distances are computed from the grid, so any zone can be a centroid of a scenario
+            self.contiguity = ContiguityIndex(
+                self.labels, self.neighbor_dict, lambda cent: grid_distances([cent], n)[0]
             )
-            self.c_count += 1
-            
-        # Add number of school balancing constraint
-        for z in range(self.Z):
-            self.file.write(f" c{self.c_count}: - " + " - ".join(f"{str(self.schoolsInArea[u])} x{u}_{z}" for u in self.units if self.schoolsInArea[u] != 0) + f" <= {str(1 - self.SCH / self.Z)} \n")
-            self.c_count += 1
-            
-            self.file.write(f" c{self.c_count}: - " + " - ".join(f"{str(self.schoolsInArea[u])} x{u}_{z}" for u in self.units if self.schoolsInArea[u] != 0) + f" >= {str(- 1 - self.SCH / self.Z)} \n")
-            self.c_count += 1
-    
-    
-    def add_variables_and_end(self):
-        self.file.write("Binaries\n")
-        for u in self.units:
-            for z in range(self.Z):
-                self.file.write(f" x{u}_{z}\n")
-                    
-        for u, v in self.neighbor_pairs:
-            self.file.write(f" b{u}_{v}\n")
-        
-        self.file.write("End\n")
+        self.compact = compact
+        self.init_model()
         
 
 if __name__ == "__main__":
     for i in range(10):
         with open(f"lp_test_files/zone_pseudo_{i}.lp", "w") as f:
-            school_zoning = SchoolZoning(f)
+            school_zoning = SchoolZoning(f, seed=i)
             school_zoning.add_objective()
             school_zoning.add_feasibility_constraints()
             school_zoning.add_balancing_constraints()
@@ -1,46 +1,165 @@
-import random
-
-# Number of cities
-n = 5000
-
-# Generate random distances (for demonstration purposes)
-distances = [[random.randint(1, 100) for _ in range(n)] for _ in range(n)]
-
-with open("tsp.lp", "w") as file:
-    file.write("Minimize\n obj: ")
-    file.write(" + ".join(f"{str(distances[i][j])} x{i+1}{j+1}" for i in range(n) for j in range(n) if i != j))
-    file.write("\nSubject To\n")
-    
-    # Each city must be entered exactly once
-    for i in range(1, n+1):
-        file.write(f" c{i}: " + " + ".join(f"x{i}{j}" for j in range(1, n+1) if i != j) + " = 1\n")
-    
-    # Each city must be left exactly once
-    for j in range(1, n+1):
-        file.write(f" c{n+j}: " + " + ".join(f"x{i}{j}" for i in range(1, n+1) if i != j) + " = 1\n")
-    
+import argparse
+import gzip
+
+import numpy as np
+
+from lp_model import TERMS_PER_LINE, format_numbers, label_strings, lp_terms, wrap_terms
+from model_writer import infer_format
+
+# Number of terms generated and written at a time, bounds the memory used by the writer
+CHUNK_TERMS = 1 << 18
+
+
+def distance_rows(n, seed, start, stop):
+    """
+    Random distances in [1, 100] from cities start..stop-1 to every city. Every row has its
+    own generator seeded with (seed, city), so the instance does not depend on the chunking.
+    """
+    return np.stack([np.random.default_rng([seed, i]).integers(1, 101, size=n) for i in range(start, stop)])
+
+
+def blocks(n, total=None):
+    """
+    Split range(total) into blocks whose rows of n terms fit in one chunk.
+    """
+    step = max(1, CHUNK_TERMS // n)
+    total = n if total is None else total
+    for start in range(0, total, step):
+        yield start, min(start + step, total)
+
+
+def arcs(start, stop, n):
+    """
+    0-based arcs (i, j), i != j, leaving the cities start..stop-1, sorted by i then j.
+    """
+    i = np.repeat(np.arange(start, stop), n)
+    j = np.tile(np.arange(n), stop - start)
+    keep = i != j
+    return i[keep], j[keep]
+
+
+def x_names(i, j):
+    return "x" + label_strings(i + 1) + "_" + label_strings(j + 1)
+
+
+def u_names(i):
+    return "u" + label_strings(i + 1)
+
+
+def mtz_row(i, j, n):
+    """
+    1-based row number of the MTZ constraint of the 0-based arc (i, j), i, j >= 1.
+    Rows 1..n enter the cities, rows n+1..2n leave them.
+    """
+    return 2 * n + (i - 1) * (n - 2) + (j - 1) - (j > i) + 1
+
+
+def row_names(rows):
+    return "c" + label_strings(rows)
+
+
+def iter_lp(n, seed):
+    """
+    Yield the CPLEX-LP text of the TSP/MTZ instance chunk by chunk.
+    """
+    yield "Minimize\n obj:"
+    for start, stop in blocks(n):
+        i, j = arcs(start, stop, n)
+        terms = lp_terms(x_names(i, j), distance_rows(n, seed, start, stop)[i - start, j])
+        terms[TERMS_PER_LINE - 1::TERMS_PER_LINE] += "\n"
+        yield "".join(terms.tolist())
+    yield "\nSubject To\n"
+
+    # Each city must be entered exactly once (rows 1..n), and left exactly once (rows n+1..2n)
+    for first_row, transpose in ((1, True), (n + 1, False)):
+        for start, stop in blocks(n):
+            i, j = arcs(start, stop, n)
+            if transpose:
+                i, j = j, i
+            indptr = np.arange(stop - start + 1) * (n - 1)
+            terms = wrap_terms(lp_terms(x_names(i, j), np.ones(len(i))), indptr)
+            terms[indptr[:-1]] = " " + row_names(np.arange(start, stop) + first_row) + ":" + terms[indptr[:-1]]
+            terms[indptr[1:] - 1] += " = 1\n"
+            yield "".join(terms.tolist())
+
     # MTZ constraints
-    constraint_count = 2 * n
-    for i in range(2, n+1):
-        for j in range(2, n+1):
-            if i != j:
-                file.write(f" u{i}u{j}: u{i} - u{j} + {n} x{i}{j} <= {n-1}\n")
-                constraint_count += 1
-
-    file.write("Bounds\n")
-    for i in range(1, n+1):
-        for j in range(1, n+1):
-            if i != j:
-                file.write(f" 0 <= x{i}{j} <= 1\n")
-    
-    file.write("Binaries\n")
-    for i in range(1, n+1):
-        for j in range(1, n+1):
-            if i != j:
-                file.write(f" x{i}{j}\n")
-                
-    file.write("General\n")
-    for i in range(2, n+1):
-        file.write(f" u{i}\n")
-    
-    file.write("End\n")
+    for start, stop in blocks(n, n - 1):
+        i, j = arcs(start + 1, stop + 1, n)
+        keep = j > 0
+        i, j = i[keep], j[keep]
+        lines = (" " + row_names(mtz_row(i, j, n)) + ": + " + u_names(i) + " - " + u_names(j)
+                 + f" + {n} " + x_names(i, j) + f" <= {n - 1}\n")
+        yield "".join(lines.tolist())
+
+    yield "Binaries\n"
+    for start, stop in blocks(n):
+        yield "".join((" " + x_names(*arcs(start, stop, n)) + "\n").tolist())
+    yield "General\n"
+    yield "".join((" " + u_names(np.arange(1, n)) + "\n").tolist())
+    yield "End\n"
+
+
+def iter_mps(n, seed):
+    """
+    Yield the free-MPS text of the TSP/MTZ instance chunk by chunk.
+    """
+    n_rows = 2 * n + (n - 1) * (n - 2)
+    yield "NAME tsp\nROWS\n N obj\n"
+    for start, stop in blocks(1, n_rows):
+        senses = np.where(np.arange(start, stop) < 2 * n, " E ", " L ").astype(object)
+        yield "".join((senses + row_names(np.arange(start, stop) + 1) + "\n").tolist())
+
+    yield "COLUMNS\n M1 'MARKER' 'INTORG'\n"
+    for start, stop in blocks(n):
+        i, j = arcs(start, stop, n)
+        names = " " + x_names(i, j)
+        d = distance_rows(n, seed, start, stop)[i - start, j]
+        lines = (names + " obj " + format_numbers(d) + "\n"
+                 + names + " " + row_names(j + 1) + " 1\n"
+                 + names + " " + row_names(n + i + 1) + " 1\n")
+        mtz = (i > 0) & (j > 0)
+        lines[mtz] += names[mtz] + " " + row_names(mtz_row(i[mtz], j[mtz], n)) + f" {n}\n"
+        yield "".join(lines.tolist())
+    yield " M1 'MARKER' 'INTEND'\n M2 'MARKER' 'INTORG'\n"
+    # u_i is +1 in the MTZ rows (i, j) and -1 in the rows (j, i)
+    for start, stop in blocks(2 * n, n - 1):
+        i, j = arcs(start + 1, stop + 1, n)
+        keep = j > 0
+        i, j = i[keep], j[keep]
+        names = " " + u_names(i)
+        lines = (names + " " + row_names(mtz_row(i, j, n)) + " 1\n"
+                 + names + " " + row_names(mtz_row(j, i, n)) + " -1\n")
+        yield "".join(lines.tolist())
+    yield " M2 'MARKER' 'INTEND'\n"
+
+    yield "RHS\n"
+    for start, stop in blocks(1, n_rows):
+        rows = np.arange(start, stop)
+        rhs = np.where(rows < 2 * n, "1", str(n - 1)).astype(object)
+        yield "".join((" RHS " + row_names(rows + 1) + " " + rhs + "\n").tolist())
+
+    yield "BOUNDS\n"
+    for start, stop in blocks(n):
+        yield "".join((" BV BND " + x_names(*arcs(start, stop, n)) + "\n").tolist())
+    yield "".join((" PL BND " + u_names(np.arange(1, n)) + "\n").tolist())
+    yield "ENDATA\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a random TSP instance with MTZ subtour constraints.")
+    parser.add_argument("--n", type=int, default=5000, help="number of cities")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="tsp.lp", help="output file (.lp or .mps, optionally .gz)")
+    args = parser.parse_args()
+
+    fmt, compressed = infer_format(args.output)
+    if fmt not in ("lp", "mps"):
+        raise ValueError("The TSP writer only streams lp and mps files")
+    chunks = iter_lp(args.n, args.seed) if fmt == "lp" else iter_mps(args.n, args.seed)
+    with (gzip.open(args.output, "wt", compresslevel=6) if compressed else open(args.output, "w")) as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,28 +3,31 @@ import pandas as pd
 
 from utils import map_centroid_to_zone, \
         generate_neighboring_pairs_and_dict, \
-        filter_nonexisting_units, generate_distance_to_centroid, \
-        filter_closer_than_cent
-from partial_map import generate_partial_map
+        filter_nonexisting_units, generate_distance_to_centroid
+from contiguity import ContiguityIndex
+from data_store import load_zoning_data
+from zoning_model import ZoningModel
 
-class SchoolZoning(object):
-    def __init__(self, file, centroids=[670, 593, 497, 723]):
+class SchoolZoning(ZoningModel):
+    def __init__(self, file=None, centroids=[670, 593, 497, 723], profile=None, compact=False, blocks=None):
+        # profile: GenerationProfile recording the generation phases (optional)
+        # compact: one b variable per undirected neighboring edge (see ZoningModel)
+        # blocks: census blocks of a regional sub-instance, e.g. from partial_map (optional)
+        self.init_profile(profile)
 
-        # Load area data
-        self.area_data = pd.read_csv("data/area_data.csv")
-        # self.area_data = self.area_data["Tract" in generate_partial_map()]
-        # print("Number of blocks: ", len(self.area_data))
-        
-        # There exists a few duplicated census blocks, we remove them
-        self.area_data = self.area_data.drop_duplicates(subset='census_block')
-        self.area_data['index'] = range(1, len(self.area_data) + 1)
+        # Load area data (deduplicated and indexed once in the preprocessing cache)
+        with self.profile.phase("load_data"):
+            self.area_data = load_zoning_data().area_data.copy()
+            if blocks is not None:
+                self.area_data = self.area_data[self.area_data['census_block'].isin(blocks)]
+                print("Number of blocks: ", len(self.area_data))
         
         units = set(self.area_data['census_block'].to_list())
         
         # Dictionary with key as index and value as census block id (area)
-        self.index_unit_map = dict(zip(self.area_data['index'], units))
+        self.index_unit_map = dict(zip(self.area_data['index'], self.area_data['census_block']))
         # The reverse of the above mapping
-        self.unit_index_map = dict(zip(units, self.area_data['index'])) 
+        self.unit_index_map = dict(zip(self.area_data['census_block'], self.area_data['index']))
         self.unit_indices = self.area_data['index']
         
         # Number of students in units (area)
@@ -48,93 +51,43 @@ class SchoolZoning(object):
         self.centroids = map_centroid_to_zone(centroids, units)
         
         # Neighbor data
-        neighbor_pairs, neighbor_dict = generate_neighboring_pairs_and_dict()
-        self.neighbor_pairs, self.neighbor_dict = filter_nonexisting_units(neighbor_pairs, neighbor_dict, units)
+        with self.profile.phase("neighbors"):
+            neighbor_pairs, neighbor_dict = generate_neighboring_pairs_and_dict()
+            self.neighbor_pairs, self.neighbor_dict = filter_nonexisting_units(neighbor_pairs, neighbor_dict, units)
         
         # Number of schools
         self.SCH = self.area_data['number_of_schools'].sum()
-        self.c_count = 1
-        
-        self.d = generate_distance_to_centroid(self.centroids, units)
-        
-    def add_objective(self):
-        
-        self.file.write("Minimize\n obj: ")
-        self.file.write(" + ".join(f"b{self.unit_index_map[float(u)]}_{self.unit_index_map[float(v)]}" for u, v in self.neighbor_pairs))
-        self.file.write("\nSubject To\n")
-        
-    def add_feasibility_constraints(self):
-        # Each area is assigned to 1 zone
-        for u in self.unit_indices:
-            self.file.write(f" c{self.c_count}: " + " + ".join(f"x{u}_{z}" for z in range(self.Z)) + " = 1\n")
-            self.c_count += 1
-        
-        # Compactness constraint
-        print("Adding Compactness constraint")
-        for u, v in self.neighbor_pairs:
-            for z in range(self.Z):
-                u_id = self.unit_index_map[u]
-                v_id = self.unit_index_map[v]
-                self.file.write(f" c{self.c_count}: x{u_id}_{z} - x{v_id}_{z} - b{u_id}_{v_id} <= 0\n")
-                self.c_count += 1
-                self.file.write(f" c{self.c_count}: x{u_id}_{z} - x{v_id}_{z} + b{u_id}_{v_id} >= 0\n")
-                self.c_count += 1
-        print("Compactness constraint added")
-                
-        # Contiguity cosntraint
-        print("Adding Contiguity constraint")
-        for u in self.unit_indices:
-            for z in range(self.Z):
-                try:
-                    cent = self.centroids[z]
-                except:
-                    print("Error", z)
-                    print(self.centroids)
-                    1/0
-                v_list = self.neighbor_dict[self.index_unit_map[u]] # List in census block id 
-                v_list = filter_closer_than_cent(v_list, self.index_unit_map[u], cent, self.d)
-                v_list = [self.unit_index_map[v] for v in v_list]
-                
-                if v_list != []:
-                    self.file.write(f" c{self.c_count}: x{u}_{z} - " + " - ".join(f"x{v}_{z}" for v in v_list) + " <= 0 \n")
-                # if v_list != []:
-                #     print(f" c{self.c_count}: x{u}_{z} - " + " - ".join(f"x{v}_{z}" for v in v_list) + " <= 0 \n")
-                self.c_count += 1
-        print("Contiguity constraint added")
-        
-    
-    def add_balancing_constraints(self):
-        # Add seat balancing constraint
-        for z in range(self.Z):
-            self.file.write(
-                f" c{self.c_count}: " + " + ".join(
-                    f"{self.seatsInArea[u] - self.studentsInArea[u]} x{u}_{z}" for u in self.unit_indices if (self.seatsInArea[u] - self.studentsInArea[u]) != 0
-                ) + " >= 0\n"
-            )
-            self.c_count += 1
-            
-        # Add number of school balancing constraint
-        for z in range(self.Z):
-            self.file.write(f" c{self.c_count}: - " + " - ".join(f"{str(self.schoolsInArea[u])} x{u}_{z}" for u in self.unit_indices if self.schoolsInArea[u] != 0) + f" <= {str(1 - self.SCH / self.Z)} \n")
-            self.c_count += 1
-            
-            self.file.write(f" c{self.c_count}: - " + " - ".join(f"{str(self.schoolsInArea[u])} x{u}_{z}" for u in self.unit_indices if self.schoolsInArea[u] != 0) + f" >= {str(- 1 - self.SCH / self.Z)} \n")
-            self.c_count += 1
-    
-    
-    def add_variables_and_end(self):
-        self.file.write("Binaries\n")
-        for u in self.unit_indices:
-            for z in range(self.Z):
-                self.file.write(f" x{u}_{z}\n")
-                    
-        for u, v in self.neighbor_pairs:
-            u_id, v_id = self.unit_index_map[u], self.unit_index_map[v]
-            self.file.write(f" b{u_id}_{v_id}\n")
-        
-        self.file.write("End\n")
         
+        with self.profile.phase("distances"):
+            self.d = generate_distance_to_centroid(self.centroids, self.area_data['census_block'])
+        
+        # Array view of the instance for the model builder (units in area_data row order)
+        self.labels = self.unit_indices.to_numpy()
+        self.students = self.area_data['number_of_students'].to_numpy()
+        self.seats = self.area_data['total_seat_capacity'].to_numpy()
+        self.schools = self.area_data['number_of_schools'].to_numpy()
+        # Positions of the units, which differ from index - 1 in regional sub-instances
+        position = {unit: i for i, unit in enumerate(self.area_data['census_block'])}
+        self.pair_u = [position[u] for u, v in self.neighbor_pairs]
+        self.pair_v = [position[v] for u, v in self.neighbor_pairs]
+        with self.profile.phase("contiguity_index"):
+            # The rows of the centroids were read into self.d, other centroids (of scenarios)
+            # are read from the distance store
+            blocks = self.area_data['census_block'].tolist()
+            self.contiguity = ContiguityIndex(blocks, self.neighbor_dict, self.centroid_distance_row)
+        self.compact = compact
+        self.init_model()
+
+    def centroid_distance_row(self, centroid):
+        if int(centroid) in self.d.index:
+            return self.d.loc[int(centroid)].to_numpy()
+        return load_zoning_data().centroid_distances([centroid], self.d.columns)[0]
+
+    def map_centroids(self, centroids):
+        # Centroids are given as school ids
+        return map_centroid_to_zone(centroids, set(self.area_data['census_block']))
         
+
 if __name__ == "__main__":
     
     lst_centroids = [[750, 830], [670, 593, 497, 723], 
@@ -142,12 +95,16 @@ if __name__ == "__main__":
                      [664, 862, 722, 867], [544, 569, 823], [723, 456, 838, 497], 
                      [497, 456, 838, 507, 625, 830, 453], [722, 420, 575, 656, 603, 680, 723], 
                      [525, 823, 834, 801, 638, 490, 562, 872]]
+    # The data is loaded once, the other centroid sets are scenarios of the first instance
+    base = None
     for i, cent in enumerate(lst_centroids):
         with open(f"lp_test_files/school/school_zoning_{i}.lp", "w") as f:
-            school_zoning = SchoolZoning(f, centroids=cent)
+            if base is None:
+                school_zoning = base = SchoolZoning(f, centroids=cent)
+            else:
+                school_zoning = base.scenario(cent, file=f)
             school_zoning.add_objective()
             school_zoning.add_feasibility_constraints()
             school_zoning.add_balancing_constraints()
             school_zoning.add_variables_and_end()
         print(f"File {i} written")
-        
\ No newline at end of file
@@ -0,0 +1,289 @@
+import contextlib
+import copy
+
+import numpy as np
+
+from lp_model import LPModel
+from model_writer import write_model
+from profiling import GenerationProfile
+
+
+def undirected_edges(pair_u, pair_v):
+    """
+    Canonicalize directed neighbor pairs to undirected edges u < v. Returns (u, v, weight)
+    where weight is the number of directed pairs merged into the edge, so that weighting
+    the edge indicator by it keeps the objective of the directed formulation. Pairs of a
+    unit with itself are dropped, they can never be cut.
+    """
+    keep = pair_u != pair_v
+    lo, hi = np.minimum(pair_u, pair_v)[keep], np.maximum(pair_u, pair_v)[keep]
+    edges, weight = np.unique(np.stack([lo, hi], axis=1), axis=0, return_counts=True)
+    return edges[:, 0], edges[:, 1], weight.astype(np.float64)
+
+
+class ZoningModel(object):
+    """
+    Common MILP formulation of the school zoning problem, shared by the real (census) and
+    pseudo (grid) instances.
+
+    Subclasses describe the instance with arrays over unit positions 0..n-1 and then call
+    self.init_model():
+        self.labels: unit ids used in the variable names (x{label}_{z}, b{label}_{label})
+        self.students, self.seats, self.schools: per unit counts
+        self.pair_u, self.pair_v: positions of the neighboring pairs
+        self.Z, self.SCH: number of zones and total number of schools
+        self.centroids: centroid unit ids of the zones
+        self.contiguity: ContiguityIndex over the units, in position order
+        self.compact: if True, the neighboring pairs are merged into undirected edges with a
+            single b variable each (see undirected_edges)
+    Subclasses call self.init_profile(profile) first to time their data preparation.
+    Generation phases, section sizes and peak memory are recorded in self.profile.
+
+    scenario(centroids) derives the model of another centroid set from a built instance,
+    reusing everything that does not depend on the centroids (see sweep).
+    """
+
+    compact = False
+    lazy_compactness = False
+
+    def init_profile(self, profile=None):
+        self.profile = GenerationProfile() if profile is None else profile
+
+    @contextlib.contextmanager
+    def section(self, name):
+        """
+        Time a block of constraints and count its rows and nonzeros.
+        """
+        rows, nnz = self.model.n_rows, self.model.nnz
+        with self.profile.phase(name):
+            yield
+        self.profile.count(f"{name}_rows", self.model.n_rows - rows)
+        self.profile.count(f"{name}_nnz", self.model.nnz - nnz)
+
+    def init_model(self):
+        self.labels = np.asarray(self.labels, dtype=np.int64)
+        self.pair_u = np.asarray(self.pair_u, dtype=np.int64)
+        self.pair_v = np.asarray(self.pair_v, dtype=np.int64)
+        # Objective weight of every b variable
+        self.pair_weight = np.ones(len(self.pair_u))
+        if self.compact:
+            self.pair_u, self.pair_v, self.pair_weight = undirected_edges(self.pair_u, self.pair_v)
+        self.students = np.asarray(self.students)
+        self.seats = np.asarray(self.seats)
+        self.schools = np.asarray(self.schools)
+        self.init_variables()
+
+    def init_variables(self):
+        """
+        Start a new LPModel with the x and b variables of the current zones.
+        """
+        n = len(self.labels)
+        self.model = LPModel()
+        # x{u}_{z} is stored at column u * Z + z
+        self.x_start = self.model.add_variables(
+            "x", np.repeat(self.labels, self.Z), np.tile(np.arange(self.Z), n)
+        )
+        # b{u}_{v} is stored at column b_start + pair index
+        self.b_start = self.model.add_variables(
+            "b", self.labels[self.pair_u], self.labels[self.pair_v]
+        )
+        self.profile.count("units", n)
+        self.profile.count("zones", self.Z)
+        self.profile.count("variables", self.model.n_vars)
+
+    def map_centroids(self, centroids):
+        """
+        Unit ids of the centroids of a scenario, see scenario().
+        """
+        return list(centroids)
+
+    def scenario(self, centroids, file=None, profile=None):
+        """
+        Derive the (empty) model of another centroid set. Data, neighbor pairs, unit maps and
+        the contiguity index (with its cached centroid distances) are shared with this
+        instance, only the variables and rows are rebuilt. Add the rows as usual.
+        """
+        scenario = copy.copy(self)
+        scenario.file = file
+        scenario.centroids = self.map_centroids(centroids)
+        scenario.Z = len(scenario.centroids)
+        scenario.lazy_compactness = False
+        scenario.init_profile(profile)
+        with scenario.profile.phase("variables"):
+            scenario.init_variables()
+        return scenario
+
+    def assignment(self, scip, solution=None):
+        """
+        Zone of every unit (position order) in a solution of a model from build_model(),
+        by default the best one.
+        """
+        solution = scip.getBestSol() if solution is None else solution
+        x = scip.getVars()[self.x_start:self.x_start + len(self.labels) * self.Z]
+        values = np.array([scip.getSolVal(solution, var) for var in x]).reshape(-1, self.Z)
+        return values.argmax(axis=1)
+
+    def add_warm_start(self, scip, previous, assignment):
+        """
+        Give a model from build_model() a partial solution derived from the assignment
+        (zone of every unit) of a previous scenario. Units of a zone whose centroid is still
+        a centroid keep it, the others go to the nearest centroid. SCIP completes or
+        discards the partial solution.
+        """
+        zone_of = {centroid: z for z, centroid in enumerate(self.centroids)}
+        kept = np.array([zone_of.get(centroid, -1) for centroid in previous.centroids])[assignment]
+        distances = np.stack([self.contiguity.distances(centroid) for centroid in self.centroids])
+        nearest = np.where(np.isnan(distances), np.inf, distances).argmin(axis=0)
+        zones = np.where(kept >= 0, kept, nearest)
+
+        x = scip.getVars()[self.x_start:self.x_start + len(self.labels) * self.Z]
+        values = np.zeros((len(self.labels), self.Z))
+        values[np.arange(len(self.labels)), zones] = 1.0
+        solution = scip.createPartialSol()
+        for var, value in zip(x, values.ravel().tolist()):
+            scip.setSolVal(solution, var, value)
+        scip.addSol(solution)
+        return zones
+
+    def sweep(self, centroid_sets, warm_start=True, params=None):
+        """
+        Build and solve the scenario of every centroid set in turn, warm starting each one
+        from the previous solution. Yields (scenario, solved pyscipopt.Model).
+        """
+        previous = None
+        for centroids in centroid_sets:
+            scenario = self.scenario(centroids)
+            scip = scenario.build_model()
+            scip.hideOutput()
+            if params:
+                scip.setParams(params)
+            if warm_start and previous is not None and previous[1].getNSols() > 0:
+                scenario.add_warm_start(scip, previous[0], previous[0].assignment(previous[1]))
+            with scenario.profile.phase("solve"):
+                scip.optimize()
+            yield scenario, scip
+            previous = scenario, scip
+
+    def x_index(self, u, z):
+        return self.x_start + np.asarray(u) * self.Z + np.asarray(z)
+
+    def add_objective(self):
+        n_pairs = len(self.pair_u)
+        self.model.set_objective(self.b_start + np.arange(n_pairs), self.pair_weight)
+
+    def add_feasibility_constraints(self, lazy_compactness=False):
+        """
+        Add the assignment, compactness and contiguity rows. With lazy_compactness, the
+        compactness rows are left out of the model and build_model() enforces them through
+        a SCIP constraint handler instead (text formats cannot express it).
+        """
+        n = len(self.labels)
+        zones = np.arange(self.Z)
+
+        # Each area is assigned to 1 zone
+        with self.section("assignment"):
+            self.model.add_constraints_dense(
+                "assignment", self.x_index(np.arange(n)[:, None], zones), 1.0, "E", 1.0
+            )
+
+        # Compactness constraint
+        self.lazy_compactness = lazy_compactness
+        print("Adding Compactness constraint")
+        with self.section("compactness"):
+            # Lazily enforced rows are left to the constraint handler of build_model()
+            if not lazy_compactness:
+                n_pairs = len(self.pair_u)
+                x_u = self.x_index(self.pair_u[:, None], zones)
+                x_v = self.x_index(self.pair_v[:, None], zones)
+                b = np.broadcast_to((self.b_start + np.arange(n_pairs))[:, None], x_u.shape)
+                # Two rows per (pair, zone): x_u - x_v - b <= 0 and x_u - x_v + b >= 0
+                indices = np.stack([x_u, x_v, b], axis=-1)
+                indices = np.stack([indices, indices], axis=2).reshape(-1, 3)
+                data = np.tile([[1.0, -1.0, -1.0], [1.0, -1.0, 1.0]], (n_pairs * self.Z, 1))
+                senses = np.tile(["L", "G"], n_pairs * self.Z)
+                self.model.add_constraints_dense("compactness", indices, data, senses, 0.0)
+        print("Compactness constraint added")
+
+        # Contiguity cosntraint
+        print("Adding Contiguity constraint")
+        with self.section("contiguity"):
+            # x_u_z - sum of x_v_z over the neighbors v closer to the centroid of z than u <= 0
+            with self.profile.phase("filter"):
+                u, z, v = self.contiguity.contiguity_terms(self.centroids)
+            rows, counts = np.unique(u * self.Z + z, return_counts=True)
+            indptr = np.concatenate(([0], np.cumsum(counts + 1)))
+            heads = np.zeros(indptr[-1], dtype=bool)
+            heads[indptr[:-1]] = True
+            indices = np.empty(indptr[-1], dtype=np.int64)
+            indices[heads] = self.x_start + rows
+            indices[~heads] = self.x_index(v, z)
+            self.model.add_constraints("contiguity", indptr, indices, np.where(heads, 1.0, -1.0), "L", 0.0)
+        # (unit, zone) pairs without any neighbor closer to the centroid get no row
+        self.profile.count("contiguity_rows_skipped", n * self.Z - len(rows))
+        print("Contiguity constraint added")
+
+    def add_balancing_constraints(self):
+        zones = np.arange(self.Z)
+
+        # Add seat balancing constraint
+        with self.section("seat_balance"):
+            surplus = self.seats - self.students
+            units = np.flatnonzero(surplus != 0)
+            self.model.add_constraints_dense(
+                "seat_balance", self.x_index(units[None, :], zones[:, None]), surplus[units], "G", 0.0
+            )
+
+        # Add number of school balancing constraint
+        with self.section("school_balance"):
+            units = np.flatnonzero(self.schools != 0)
+            indices = self.x_index(units[None, :], zones[:, None])
+            indices = np.repeat(indices, 2, axis=0)
+            senses = np.tile(["L", "G"], self.Z)
+            rhs = np.tile([1 - self.SCH / self.Z, -1 - self.SCH / self.Z], self.Z)
+            self.model.add_constraints_dense("school_balance", indices, -self.schools[units], senses, rhs)
+
+    def add_variables_and_end(self):
+        if self.lazy_compactness:
+            raise ValueError("Lazy compactness rows are only enforced in models from build_model()")
+        sizes = {}
+        with self.profile.phase("write"):
+            self.model.write_lp(self.file, section_sizes=sizes)
+        self.profile.add_counts("chars", sizes)
+
+    def write(self, path, fmt=None, sidecar=False, name=None):
+        """
+        Write the model to path as LP, MPS or NPZ (optionally gzip-compressed, e.g.
+        school_zoning_0.mps.gz), see model_writer.write_model. name overrides the model name
+        taken from the file name.
+        """
+        if self.lazy_compactness:
+            raise ValueError("Lazy compactness rows are only enforced in models from build_model()")
+        sizes = {}
+        with self.profile.phase("write"):
+            written = write_model(self.model, path, fmt, sidecar=sidecar, section_sizes=sizes, name=name)
+        self.profile.add_counts("chars", sizes)
+        return written
+
+    def build_model(self, ecole=False):
+        """
+        Build the model directly in SCIP, skipping the LP file round-trip. Returns a
+        pyscipopt.Model, or an ecole.scip.Model if ecole is True.
+        """
+        if self.model.n_rows == 0:
+            self.add_objective()
+            self.add_feasibility_constraints()
+            self.add_balancing_constraints()
+        with self.profile.phase("to_scip"):
+            model = self.model.to_scip("school_zoning")
+        if self.lazy_compactness:
+            from compactness import include_compactness_handler
+            variables = np.empty(self.model.n_vars, dtype=object)
+            variables[:] = model.getVars()
+            x = variables[self.x_start:self.x_start + len(self.labels) * self.Z].reshape(-1, self.Z)
+            b = variables[self.b_start:self.b_start + len(self.pair_u)]
+            # Keep a reference to the handler, SCIP does not own the Python object
+            self.compactness_handler = include_compactness_handler(model, x, b, self.pair_u, self.pair_v)
+        if ecole:
+            import ecole as ec
+            return ec.scip.Model.from_pyscipopt(model)
+        return model